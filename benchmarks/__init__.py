@@ -0,0 +1,6 @@
+""" dbtidy benchmarks package.
+
+    Usage: python -m benchmarks --help
+"""
+
+# end
@@ -0,0 +1,76 @@
+""" Command line interface to the dbtidy benchmarks.
+
+    e.g.  python -m benchmarks --sizes 1K,1M,10M --save baseline.json
+          python -m benchmarks --sizes 1K,1M,10M --compare baseline.json
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from dbtidy import io_pipeline
+
+from . import generator
+from . import harness
+
+
+def input_file(data_dir, size_text, kind, seed):
+    """ Returns the name of the generated input file, generating it if needs be.
+    """
+    filename = os.path.join(data_dir, "%s-%s-%s.%s" % (kind, size_text, seed, kind))
+    if not os.path.exists(filename):
+        os.makedirs(data_dir, exist_ok=True)
+        generator.generate_file(filename + ".tmp", io_pipeline.parse_size(size_text), seed, kind)
+        os.replace(filename + ".tmp", filename)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="dbtidy lexing and formatting benchmarks")
+    parser.add_argument("--sizes", default="1K,100K,1M,10M",
+                        help="comma separated input sizes, e.g. 1K,1M,500M")
+    parser.add_argument("--kinds", default="db,dbd",
+                        help="comma separated input kinds: db and/or dbd")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timing is the best of this many runs")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the peak memory measurements")
+    parser.add_argument("--data-dir",
+                        default=os.path.join(tempfile.gettempdir(), "dbtidy-benchmarks"),
+                        help="where generated inputs are kept between runs")
+    parser.add_argument("--save", metavar="FILE", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare results with a baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="fractional change flagged as a regression")
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    for size_text in sizes:
+        if io_pipeline.parse_size(size_text) is None:
+            parser.error("invalid size: '%s'" % size_text)
+
+    results = {}
+    for kind in args.kinds.split(","):
+        for size_text in sizes:
+            filename = input_file(args.data_dir, size_text, kind, args.seed)
+            results["%s-%s" % (kind, size_text)] = \
+                harness.measure(filename, args.repeat, not args.no_memory)
+
+    harness.report(results, sys.stdout)
+
+    if args.save:
+        harness.save(results, args.save)
+
+    if args.compare:
+        if harness.compare(results, args.compare, args.threshold, sys.stdout) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# end
@@ -0,0 +1,169 @@
+""" This module generates synthetic, but realistic, EPICS database and dbd
+    files for benchmarking. For a given seed and size the output is always
+    the same. The layout is deliberately untidy, so that dbtidy has work to do.
+"""
+
+import random
+
+record_types = ("ai", "ao", "bi", "bo", "calc", "calcout", "longin", "longout",
+                "mbbi", "mbbo", "stringin", "stringout", "waveform", "seq")
+
+field_names = ("DESC", "SCAN", "PINI", "PHAS", "EVNT", "DTYP", "DISV", "SDIS",
+               "FLNK", "PREC", "EGU", "HOPR", "LOPR", "HIHI", "LOLO", "HIGH",
+               "LOW", "HHSV", "LLSV", "HSV", "LSV", "HYST", "ADEL", "MDEL",
+               "INP", "OUT", "DOL", "OMSL", "CALC", "INPA", "INPB", "VAL",
+               "NELM", "FTVL", "ZNAM", "ONAM", "ASG", "TSE", "PRIO", "ZRST")
+
+scan_values = ("Passive", "Event", "I/O Intr", "10 second", "5 second",
+               "2 second", "1 second", ".5 second", ".2 second", ".1 second")
+
+menu_names = ("menuScan", "menuAlarmSevr", "menuYesNo", "menuPriority",
+              "menuOmsl", "menuFtype", "menuIvoa")
+
+gaps = ("", " ", " ", " ", "  ", "\t")
+
+
+class _writer (object):
+    """ Accumulates text, and counts characters written so far.
+    """
+    def __init__(self, target):
+        self.target = target
+        self.size = 0
+
+    def write(self, text):
+        self.target.write(text)
+        self.size += len(text)
+
+
+def _word(rnd, low=3, high=12):
+    return "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz")
+                   for _ in range(rnd.randint(low, high)))
+
+
+def _pv_name(rnd):
+    return "$(P)%s:%s%d" % (_word(rnd, 2, 6).upper(), _word(rnd).capitalize(),
+                            rnd.randint(0, 999))
+
+
+def _field_value(rnd, name):
+    choice = rnd.random()
+    if name == "SCAN":
+        return '"%s"' % rnd.choice(scan_values)
+    if name in ("INP", "OUT", "DOL", "FLNK", "INPA", "INPB"):
+        if choice < 0.3:
+            return '"@asyn($(PORT),%d,1)%s"' % (rnd.randint(0, 64), _word(rnd))
+        return '"%s %s"' % (_pv_name(rnd), rnd.choice(("CP", "NPP", "PP MS", "CPP")))
+    if name == "CALC":
+        return '"(A+B)*%d/C>=D?E:F"' % rnd.randint(1, 100)
+    if choice < 0.02:
+        # Very long string, e.g. a generated waveform or JSON link.
+        return '"%s"' % ",".join(str(rnd.randint(-999, 999))
+                                 for _ in range(rnd.randint(200, 2000)))
+    if choice < 0.05:
+        return '"\\"%s\\" \\\\n"' % _word(rnd)
+    if choice < 0.15:
+        return "$(%s)" % _word(rnd, 3, 8).upper()
+    if choice < 0.45:
+        return str(rnd.choice((rnd.randint(-1000, 1000), round(rnd.uniform(-1e6, 1e6), 3),
+                               "%.3e" % rnd.uniform(-1e9, 1e9))))
+    return '"%s"' % " ".join(_word(rnd) for _ in range(rnd.randint(1, 6)))
+
+
+def _comment(rnd):
+    if rnd.random() < 0.3:
+        return "#!! %s %s" % (rnd.choice(("archive", "autosave", "alarm")), _word(rnd))
+    return "# " + " ".join(_word(rnd) for _ in range(rnd.randint(1, 10)))
+
+
+def _write_record(rnd, out):
+    g = lambda: rnd.choice(gaps)
+    if rnd.random() < 0.2:
+        out.write(_comment(rnd) + "\n")
+
+    keyword = "grecord" if rnd.random() < 0.05 else "record"
+    out.write('%s%s(%s%s,%s"%s")%s{\n' % (keyword, g(), g(), rnd.choice(record_types),
+                                          g(), _pv_name(rnd), g()))
+
+    for _ in range(rnd.randint(3, 30)):
+        name = rnd.choice(field_names)
+        if rnd.random() < 0.05:
+            out.write("%s$(%s)" % (g(), _word(rnd, 3, 6).upper()))
+        out.write("%sfield%s(%s%s%s,%s%s%s)" % (g(), g(), g(), name, g(), g(),
+                                               _field_value(rnd, name), g()))
+        if rnd.random() < 0.1:
+            out.write("%s%s" % (g(), _comment(rnd)))
+        out.write("\n")
+
+    for _ in range(rnd.randint(0, 3)):
+        out.write('%sinfo(%s,%s"%s")\n' % (g(), rnd.choice(("autosaveFields", "archive", "Q:group")),
+                                           g(), _word(rnd)))
+
+    if rnd.random() < 0.1:
+        out.write('%salias("%s")\n' % (g(), _pv_name(rnd)))
+
+    out.write("}\n")
+    if rnd.random() < 0.5:
+        out.write("\n")
+
+    if rnd.random() < 0.05:
+        out.write('alias("%s",%s"%s")\n' % (_pv_name(rnd), g(), _pv_name(rnd)))
+
+
+def _write_dbd_definition(rnd, out):
+    g = lambda: rnd.choice(gaps)
+    choice = rnd.random()
+    if choice < 0.4:
+        out.write("recordtype(%s%s) {\n" % (g(), _word(rnd)))
+        out.write('%sinclude "dbCommon.dbd"\n' % g())
+        for _ in range(rnd.randint(5, 40)):
+            out.write("%sfield(%s,%sDBF_%s) {\n" % (g(), rnd.choice(field_names), g(),
+                      rnd.choice(("DOUBLE", "LONG", "STRING", "MENU", "INLINK"))))
+            out.write('%sprompt("%s")\n' % (g(), " ".join(_word(rnd) for _ in range(3))))
+            out.write('%spromptgroup("%d%d - %s")\n' % (g(), rnd.randint(1, 9), 0, _word(rnd)))
+            if rnd.random() < 0.5:
+                out.write("%sspecial(SPC_MOD)%sinterest(%d)\n" % (g(), g(), rnd.randint(0, 4)))
+            if rnd.random() < 0.3:
+                out.write("%sasl(ASL0)%spp(TRUE)\n" % (g(), g()))
+            if rnd.random() < 0.2:
+                out.write('%ssize(40)%sinitial("0")%sextra("void *%s")\n' % (g(), g(), g(), _word(rnd)))
+            if rnd.random() < 0.2:
+                out.write("%smenu(%s)\n" % (g(), rnd.choice(menu_names)))
+            out.write("%s}\n" % g())
+        out.write("}\n\n")
+
+    elif choice < 0.7:
+        name = "menu" + _word(rnd).capitalize()
+        out.write("menu(%s) {\n" % name)
+        for _ in range(rnd.randint(2, 16)):
+            word = _word(rnd)
+            out.write('%schoice(%s%s,%s"%s")\n' % (g(), name, word.capitalize(), g(), word))
+        out.write("}\n")
+
+    elif choice < 0.9:
+        out.write('device(%s,%s%s,%sdev%s,%s"%s")\n' % (rnd.choice(record_types), g(),
+                  rnd.choice(("CONSTANT", "INST_IO", "VME_IO")), g(), _word(rnd).capitalize(),
+                  g(), _word(rnd)))
+    else:
+        out.write("%s(%s)\n" % (rnd.choice(("driver", "registrar", "function", "variable")),
+                                _word(rnd)))
+
+
+def generate(target, size, seed=0, kind="db"):
+    """ Writes at least size characters of generated kind ("db" or "dbd")
+        content to target, any text file like object.
+    """
+    rnd = random.Random("%s:%s" % (seed, kind))
+    out = _writer(target)
+    out.write("# Generated by dbtidy benchmarks, seed %s\n\n" % seed)
+    while out.size < size:
+        if kind == "dbd":
+            _write_dbd_definition(rnd, out)
+        else:
+            _write_record(rnd, out)
+
+
+def generate_file(filename, size, seed=0, kind="db"):
+    with open(filename, 'w') as target:
+        generate(target, size, seed, kind)
+
+# end
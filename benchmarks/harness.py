@@ -0,0 +1,142 @@
+""" This module measures lexing and formatting throughput and peak memory,
+    separately, for a set of input files, and compares results with a stored
+    baseline.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+
+from dbtidy import dbtidy_lib
+from dbtidy import io_pipeline
+from dbtidy import lexer
+
+
+def size_argument(text):
+    """ Converts a size argument, e.g. "500M", to bytes, as an argparse type.
+    """
+    size = io_pipeline.parse_size(text)
+    if size is None:
+        raise argparse.ArgumentTypeError("invalid size: '%s'" % text)
+    return size
+
+
+class null_target (object):
+    """ Discards all output, so that only the formatter itself is measured.
+    """
+    def write(self, text):
+        pass
+
+
+def _lex(filename):
+    with lexer.lex_file(filename, True) as source:
+        return source.get_token_buffer()
+
+
+def _best_time(function, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(filename, repeat=3, memory=True):
+    """ Measures lexing filename into a token_buffer, and formatting that
+        token_buffer, each the best of repeat runs. Peak memory is measured
+        in separate runs, as tracing distorts the timing. Warnings are
+        discarded.
+    """
+    with contextlib.redirect_stderr(null_target()):
+        return _measure(filename, repeat, memory)
+
+
+def _measure(filename, repeat, memory):
+    size = os.path.getsize(filename)
+
+    lex_seconds, tokens = _best_time(lambda: _lex(filename), repeat)
+    format_seconds, _ = _best_time(lambda: dbtidy_lib.process(tokens, null_target()), repeat)
+
+    def phase(seconds, peak):
+        seconds = max(seconds, 1e-9)
+        return {"seconds": seconds,
+                "tokens_per_s": len(tokens) / seconds,
+                "mb_per_s": size / seconds / 1e6,
+                "peak_bytes": peak}
+
+    lex_peak = _peak_memory(lambda: _lex(filename)) if memory else None
+    format_peak = _peak_memory(lambda: dbtidy_lib.process(tokens, null_target())) if memory else None
+
+    return {"size": size,
+            "tokens": len(tokens),
+            "lex": phase(lex_seconds, lex_peak),
+            "format": phase(format_seconds, format_peak)}
+
+
+def report(results, out):
+    """ Writes a human readable table of results.
+    """
+    out.write("%-24s %12s %10s  %-6s %12s %9s %12s\n" %
+              ("input", "bytes", "tokens", "phase", "tokens/s", "MB/s", "peak bytes"))
+    for name, result in results.items():
+        for phase in ("lex", "format"):
+            values = result[phase]
+            peak = values["peak_bytes"]
+            out.write("%-24s %12d %10d  %-6s %12.0f %9.2f %12s\n" %
+                      (name, result["size"], result["tokens"], phase,
+                       values["tokens_per_s"], values["mb_per_s"],
+                       "-" if peak is None else "%d" % peak))
+
+
+def save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline_filename, threshold, out):
+    """ Compares results with the baseline results in baseline_filename, and
+        reports any throughput drop or peak memory rise of more than threshold
+        (a fraction). Returns the number of regressions.
+    """
+    with open(baseline_filename, 'r') as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            out.write("%-24s no baseline\n" % name)
+            continue
+
+        for phase in ("lex", "format"):
+            now = result[phase]
+            then = baseline[name][phase]
+
+            ratio = now["tokens_per_s"] / then["tokens_per_s"]
+            flag = "REGRESSION" if ratio < 1.0 - threshold else ""
+            out.write("%-24s %-6s throughput %6.1f%% %s\n" % (name, phase, 100.0 * ratio, flag))
+            regressions += bool(flag)
+
+            if now["peak_bytes"] and then.get("peak_bytes"):
+                ratio = now["peak_bytes"] / then["peak_bytes"]
+                flag = "REGRESSION" if ratio > 1.0 + threshold else ""
+                out.write("%-24s %-6s peak mem   %6.1f%% %s\n" % (name, phase, 100.0 * ratio, flag))
+                regressions += bool(flag)
+
+    return regressions
+
+# end
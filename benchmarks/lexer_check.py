@@ -0,0 +1,143 @@
+""" Differential check of the NumPy lexer backend against the pure Python lexer:
+    lexes generated database and dbd files, and randomly mutated copies of
+    them, both ways, in text and byte mode, and reports any difference in the
+    items, i.e. their kinds, offsets, line and col numbers. Also reports the
+    time taken by each lexer.
+
+    e.g.  python -m benchmarks.lexer_check --files 20 --size 200K
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+
+from dbtidy import lexer
+from dbtidy import numpy_lexer
+
+from . import generator
+from . import harness
+
+# The characters used to mutate the generated files, weighted towards those
+# with special meaning to the lexer.
+#
+mutation_chars = '""\\\\$$(())##{}[],,+-..::eE09aZ \t\t\n\n\r\f\v\x1c_!@;'
+byte_mutation_chars = mutation_chars + "\x80\x85\xa0\xc3\xa9\xff"
+
+
+def python_buffer(text, binary):
+    """ Returns the token_buffer of text, as lexed by the pure Python lexer.
+    """
+    saved = lexer.numpy_threshold
+    lexer.numpy_threshold = None
+    try:
+        with lexer.lex_file("<check>", True, io.StringIO(text), binary=binary) as source:
+            return source.get_token_buffer()
+    finally:
+        lexer.numpy_threshold = saved
+
+
+def mutate(rnd, text, count, chars):
+    """ Returns text with count random single character insertions, deletions
+        and replacements.
+    """
+    text = list(text)
+    for _ in range(count):
+        index = rnd.randrange(len(text) + 1)
+        choice = rnd.random()
+        if choice < 0.4 or index == len(text):
+            text.insert(index, rnd.choice(chars))
+        elif choice < 0.7:
+            del text[index]
+        else:
+            text[index] = rnd.choice(chars)
+    return "".join(text)
+
+
+def first_difference(expected, actual):
+    """ Returns a description of the first difference between two token
+        buffers, or None if they are the same.
+    """
+    for index in range(min(len(expected), len(actual))):
+        if (expected.kinds[index], expected.starts[index], expected.ends[index],
+                expected.lines[index], expected.cols[index]) != \
+                (actual.kinds[index], actual.starts[index], actual.ends[index],
+                 actual.lines[index], actual.cols[index]):
+            return "item %d: expected %s, got %s" % (index, expected.item(index),
+                                                    actual.item(index))
+    if len(expected) != len(actual):
+        return "expected %d items, got %d" % (len(expected), len(actual))
+    if (expected.eof_line_number, expected.eof_col_number) != \
+            (actual.eof_line_number, actual.eof_col_number):
+        return "expected end of file at %d:%d, got %d:%d" % \
+            (expected.eof_line_number, expected.eof_col_number,
+             actual.eof_line_number, actual.eof_col_number)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.lexer_check",
+                                     description="NumPy lexer backend differential check")
+    parser.add_argument("--files", type=int, default=10,
+                        help="the number of generated files of each kind (default %(default)s)")
+    parser.add_argument("--size", type=harness.size_argument, default="100K",
+                        help="the size of each generated file (default %(default)s)")
+    parser.add_argument("--mutations", type=int, default=20,
+                        help="the mutated copies of each file (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=harness.size_argument, default=None,
+                        help="the NumPy lexer's chunk size, e.g. 1K, to check chunking")
+    args = parser.parse_args()
+
+    if not numpy_lexer.available:
+        print("NumPy is not available - nothing to check", file=sys.stderr)
+        return 1
+
+    size = args.size
+    if args.chunk_size is not None:
+        numpy_lexer.chunk_size = args.chunk_size
+    rnd = random.Random(args.seed)
+
+    checked = 0
+    failures = 0
+    python_time = 0.0
+    numpy_time = 0.0
+
+    for seed in range(args.seed, args.seed + args.files):
+        for kind in ("db", "dbd"):
+            target = io.StringIO()
+            generator.generate(target, size, seed, kind)
+            original = target.getvalue()
+
+            for variant in range(args.mutations + 1):
+                for binary in (False, True):
+                    text = original
+                    if variant > 0:
+                        chars = byte_mutation_chars if binary else mutation_chars
+                        text = mutate(rnd, original, rnd.randint(1, 200), chars)
+
+                    start = time.perf_counter()
+                    expected = python_buffer(text, binary)
+                    python_time += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    actual = numpy_lexer.lex_text(text, binary)
+                    numpy_time += time.perf_counter() - start
+
+                    checked += 1
+                    difference = first_difference(expected, actual)
+                    if difference is not None:
+                        failures += 1
+                        print("%s seed %d variant %d%s: %s" %
+                              (kind, seed, variant, " (bytes)" if binary else "", difference))
+
+    print("%d inputs checked, %d differ" % (checked, failures))
+    print("python lexer %.2f s, numpy lexer %.2f s" % (python_time, numpy_time))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# end
@@ -0,0 +1,112 @@
+""" Check of the parse model: parses generated database and dbd files, and
+    randomly mutated copies of them, and reports any file for which the
+    document's tokens differ from the token_buffer's, or its rendering from
+    the formatter's output. Also reports the parse time, and the peak memory
+    of the model against that of the equivalent list of lex_items.
+
+    e.g.  python -m benchmarks.model_check --files 10 --size 100K
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+
+from dbtidy import dbtidy_lib
+from dbtidy import lexer
+from dbtidy import parse_model
+
+from . import generator
+from . import harness
+from .lexer_check import mutate, mutation_chars
+
+
+def check(text):
+    """ Returns a description of the first problem with the model of text,
+        or None.
+    """
+    with lexer.lex_file("<check>", True, io.StringIO(text)) as source:
+        buffer = source.get_token_buffer()
+
+    document = parse_model.parse(buffer)
+    if list(document.tokens()) != list(buffer.tokens()):
+        return "document tokens differ"
+
+    expected = io.StringIO()
+    dbtidy_lib.process(buffer, expected)
+    if parse_model.render_text(document) != expected.getvalue():
+        return "rendering differs"
+    return None
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        result = function()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.model_check",
+                                     description="dbtidy parse model check")
+    parser.add_argument("--files", type=int, default=10,
+                        help="the number of generated files of each kind (default %(default)s)")
+    parser.add_argument("--size", type=harness.size_argument, default="100K",
+                        help="the size of each generated file (default %(default)s)")
+    parser.add_argument("--mutations", type=int, default=20,
+                        help="the mutated copies of each file (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    size = args.size
+    rnd = random.Random(args.seed)
+
+    checked = 0
+    failures = 0
+    with contextlib.redirect_stderr(harness.null_target()):
+        for seed in range(args.seed, args.seed + args.files):
+            for kind in ("db", "dbd"):
+                target = io.StringIO()
+                generator.generate(target, size, seed, kind)
+                original = target.getvalue()
+
+                for variant in range(args.mutations + 1):
+                    text = original
+                    if variant > 0:
+                        text = mutate(rnd, original, rnd.randint(1, 200), mutation_chars)
+
+                    checked += 1
+                    problem = check(text)
+                    if problem is not None:
+                        failures += 1
+                        print("%s seed %d variant %d: %s" % (kind, seed, variant, problem))
+
+    print("%d inputs checked, %d differ" % (checked, failures))
+
+    # Time and memory, for the last file generated.
+    #
+    with lexer.lex_file("<check>", True, io.StringIO(original)) as source:
+        buffer = source.get_token_buffer()
+
+    start = time.perf_counter()
+    document = parse_model.parse(buffer)
+    seconds = time.perf_counter() - start
+
+    model_peak, document = peak_memory(lambda: parse_model.parse(buffer))
+    items_peak, items = peak_memory(lambda: [buffer.item(index) for index in range(len(buffer))])
+    print("%d tokens, %d nodes, parsed in %.3f s" %
+          (len(buffer), sum(1 for _ in document.walk()), seconds))
+    print("model %.1f MB, lex_items %.1f MB" % (model_peak / 1e6, items_peak / 1e6))
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# end
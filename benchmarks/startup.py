@@ -0,0 +1,104 @@
+""" Start up time benchmark: measures the wall clock time of dbtidy --version,
+    and of tidying a 10 line file, each as a new process, and checks these
+    against a time budget.
+
+    e.g.  python -m benchmarks.startup --repeat 20 --version-budget 60
+"""
+
+import argparse
+import os
+import os.path
+import subprocess
+import sys
+import tempfile
+import time
+
+# The 10 line, untidy, file; re-written before each run, so that each run has
+# the same work to do.
+#
+ten_lines = """\
+# Start up benchmark
+record(ai,"$(P)ai") {
+field(DESC,"An analog input")
+field(SCAN,"1 second")
+field(INP,"$(P)calc")
+}
+record(calc,"$(P)calc") {
+field(CALC,"A+1")
+field(INPA,"$(P)calc")
+}
+"""
+
+
+def run_time(command, env, cwd, before=None):
+    """ Returns the wall clock time (in seconds) of running command.
+    """
+    if before is not None:
+        before()
+    start = time.perf_counter()
+    subprocess.run(command, env=env, cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure(command, repeat, env, cwd, before=None):
+    """ Returns the best and median times (in seconds) of repeat runs.
+    """
+    times = sorted(run_time(command, env, cwd, before) for _ in range(repeat))
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup",
+                                     description="dbtidy start up time benchmark")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="the number of runs of each command (default %(default)s)")
+    parser.add_argument("--version-budget", type=float, default=80.0,
+                        help="the budget (ms) for dbtidy --version (default %(default)s)")
+    parser.add_argument("--tidy-budget", type=float, default=150.0,
+                        help="the budget (ms) for tidying a 10 line file (default %(default)s)")
+    args = parser.parse_args()
+
+    # Run the dbtidy in this source tree.
+    #
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (root, env.get("PYTHONPATH"))))
+
+    with tempfile.TemporaryDirectory(prefix="dbtidy-startup-") as work:
+        env["XDG_CACHE_HOME"] = work
+        filename = os.path.join(work, "ten.db")
+
+        def write_file():
+            with open(filename, 'w') as f:
+                f.write(ten_lines)
+
+        python = [sys.executable, "-c", "pass"]
+        version = [sys.executable, "-m", "dbtidy", "--version"]
+        tidy = [sys.executable, "-m", "dbtidy", "--no-cache", filename]
+
+        results = [("python", measure(python, args.repeat, env, work), None),
+                   ("--version", measure(version, args.repeat, env, work),
+                    args.version_budget),
+                   ("10 lines", measure(tidy, args.repeat, env, work, write_file),
+                    args.tidy_budget)]
+
+    status = 0
+    print("%-10s %10s %10s %10s" % ("command", "best ms", "median ms", "budget ms"))
+    for name, (best, median), budget in results:
+        verdict = ""
+        if budget is not None:
+            if median * 1000.0 > budget:
+                verdict = "  OVER BUDGET"
+                status = 1
+        print("%-10s %10.1f %10.1f %10s%s" %
+              (name, best * 1000.0, median * 1000.0,
+               "-" if budget is None else "%.0f" % budget, verdict))
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# end
@@ -4,4 +4,16 @@
 __version__ = "2.1.1"
 __license__ = "GPL3"
 
+# The in memory interface, e.g. dbtidy.tidy_text(text). These are imported
+# on first use so that importing just the version remains cheap.
+#
+_lib_names = ("tidy_text", "tidy_bytes", "tidy_stream", "tidy_range")
+
+
+def __getattr__(name):
+    if name in _lib_names:
+        from . import dbtidy_lib
+        return getattr(dbtidy_lib, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 # end
@@ -0,0 +1,10 @@
+""" Allows dbtidy to be run as: python -m dbtidy
+"""
+
+import sys
+
+from .main import main
+
+sys.exit(main())
+
+# end
@@ -0,0 +1,90 @@
+""" This module provides a persistent record of files known to be tidy, so that
+    unchanged files may be skipped on subsequent runs.
+"""
+
+import hashlib
+import json
+import os
+import os.path
+
+from . import __version__
+
+
+def default_filename(mode="text"):
+    """ Returns the default cache file name, as per the XDG conventions, for
+        files read in the given mode, text or bytes.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    if mode != "text":
+        return os.path.join(base, "dbtidy", "tidy_cache_%s.json" % mode)
+    return os.path.join(base, "dbtidy", "tidy_cache.json")
+
+
+def content_digest(data):
+    """ Returns the digest (a hex string) of the file content data (bytes).
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# -----------------------------------------------------------------------------
+#
+class tidy_cache (object):
+    """ Maps each file's absolute path to an entry, (size, mtime_ns, digest), of
+        the file as it was when last known to be tidy, when read in the given
+        mode, text or bytes. The whole cache is discarded when written by a
+        different version of dbtidy, or for a different mode.
+    """
+
+    def __init__(self, filename=None, mode="text"):
+        self.filename = filename or default_filename(mode)
+        self.mode = mode
+        self.entries = {}
+        self.modified = False
+
+        try:
+            with open(self.filename, 'r') as f:
+                content = json.load(f)
+            if content.get("version") == __version__ and \
+                    content.get("mode", "text") == mode:
+                self.entries = {path: tuple(entry) for path, entry in
+                                content.get("files", {}).items()}
+        except (OSError, ValueError, AttributeError):
+            # Missing or corrupt - start afresh.
+            pass
+
+
+    def lookup(self, filename):
+        """ Returns the cache entry for filename, or None.
+        """
+        return self.entries.get(os.path.abspath(filename))
+
+
+    def update(self, filename, entry):
+        """ Records (or, if entry is None, forgets) filename's entry.
+        """
+        path = os.path.abspath(filename)
+        if entry is None:
+            if self.entries.pop(path, None) is not None:
+                self.modified = True
+        elif self.entries.get(path) != entry:
+            self.entries[path] = entry
+            self.modified = True
+
+
+    def save(self):
+        """ Writes the cache, if modified, via a temporary file so that a
+            concurrent reader never sees a partial cache.
+        """
+        if not self.modified:
+            return
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temp = "%s.%d" % (self.filename, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump({"version": __version__, "mode": self.mode,
+                       "files": self.entries}, f)
+        os.replace(temp, self.filename)
+        self.modified = False
+
+# end
@@ -0,0 +1,165 @@
+""" This module provides a thin client for the dbtidy server. It only imports
+    the rest of dbtidy if no server is running, in which case the requests are
+    handled in process.
+"""
+
+import json
+import os
+import socket
+import sys
+
+_local_server = None
+
+
+class server_error (Exception):
+    """ Raised when the server returns an error response.
+    """
+    pass
+
+
+def default_address():
+    """ As per server.default_address, without importing the server.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        return os.path.join(base, "dbtidy.sock")
+    return os.path.join("/tmp", "dbtidy-%d.sock" % os.getuid())
+
+
+def call_server(address, method, params):
+    """ Sends the request to the server listening on address and returns the
+        response. Raises OSError if there is no server.
+    """
+    request = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(address)
+        with connection.makefile('rw', encoding="utf-8", errors="surrogatepass",
+                                 newline="\n") as stream:
+            stream.write(json.dumps(request) + "\n")
+            stream.flush()
+            line = stream.readline()
+
+    if not line:
+        raise ConnectionResetError("no response from %s" % address)
+    return json.loads(line)
+
+
+def call_local(method, params):
+    """ Handles the request in process.
+    """
+    global _local_server
+    if _local_server is None:
+        from . import server
+        _local_server = server.tidy_server()
+
+    request = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    return json.loads(_local_server.handle(json.dumps(request)))
+
+
+def call(method, params, address=None):
+    """ Calls method on the server listening on address (or the default), or
+        if there is no such server, in process. Returns the result.
+    """
+    try:
+        response = call_server(address or default_address(), method, params)
+    except OSError:
+        response = call_local(method, params)
+
+    if "error" in response:
+        raise server_error(response["error"]["message"])
+    return response["result"]
+
+
+def tidy_text(text, filename="<text>", lines=None, address=None):
+    """ Returns the result dict, text, changed and warnings, of tidying text.
+    """
+    params = {"text": text, "filename": filename}
+    if lines is not None:
+        params["lines"] = list(lines)
+    return call("tidy", params, address)
+
+
+def tidy_file(path, lines=None, check=False, address=None):
+    """ Tidies the file path in place, or if check, checks if tidy. Returns the
+        result dict, changed (or tidy) and warnings.
+    """
+    params = {"path": os.path.abspath(path), "check": check}
+    if lines is not None:
+        params["lines"] = list(lines)
+    return call("tidy_file", params, address)
+
+
+# The command line structure is too simple to warrent using Click.
+#
+def main():
+    name = os.path.basename(sys.argv.pop(0))    # drop the program name
+
+    address = None
+    check = False
+    lines = None
+    paths = []
+
+    for arg in sys.argv:
+        if arg in ("-h", "--help"):
+            print("""\
+usage: {name} [options] filenames...
+       {name} [options] -
+
+{name} tidies the files using the dbtidy server, see dbtidy --serve, or if
+no server is running, in process. If the filename is -, the standard input
+is tidied and written to the standard output.
+
+options:
+  --socket=PATH   the server socket, the default is: {address}
+  --check         check only, and exit with status 1 if any file is not tidy.
+  --lines=FIRST[:LAST]
+                  only tidy the records enclosing lines FIRST to LAST.
+""".format(name=name, address=default_address()))
+            return
+
+        if arg.startswith("--socket="):
+            address = arg[9:]
+
+        elif arg == "--check":
+            check = True
+
+        elif arg.startswith("--lines="):
+            first, _, last = arg[8:].partition(":")
+            last = last or first
+            if not (first.isdigit() and last.isdigit()):
+                print("%s: invalid line range: '%s'" % (name, arg[8:]))
+                return 1
+            lines = (int(first), int(last))
+
+        else:
+            paths.append(arg)
+
+    status = 0
+    for path in paths:
+        try:
+            if path == "-":
+                result = tidy_text(sys.stdin.read(), "<stdin>", lines, address)
+                sys.stdout.write(result["text"])
+                tidy = not result["changed"]
+            else:
+                result = tidy_file(path, lines, check, address)
+                tidy = result["tidy"] if check else True
+        except (OSError, server_error) as error:
+            print("%s: %s: %s" % (name, path, error), file=sys.stderr)
+            status = 1
+            continue
+
+        for warning in result["warnings"]:
+            print(warning, file=sys.stderr)
+
+        if check and not tidy:
+            print("%s: not tidy" % path)
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# end
@@ -3,4 +3,9 @@
 
 source_file_name = None
 
+# The sorted (first, last) line ranges of source_file_name to which warnings
+# are restricted, or None for all lines.
+#
+warning_lines = None
+
 # end
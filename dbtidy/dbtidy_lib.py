@@ -1,7 +1,13 @@
 """ This module provided the main dbtidy logic.
 """
 
+import bisect
+import io
+import locale
+import os
+import re
 import sys
+import time
 
 from . import ordered_enum
 from . import lexer
@@ -9,11 +15,18 @@ from . import common
 
 OrderedEnum = ordered_enum.OrderedEnum
 lex_kinds = lexer.lex_kinds
+lex_codes = lexer.lex_codes
 lex_items = lexer.lex_items
 lex_file  = lexer.lex_file
+kind_of_code = lexer.kind_of_code
 
 
 def warning(lex_item, text):
+    ranges = common.warning_lines
+    if ranges is not None:
+        index = bisect.bisect_right(ranges, (lex_item.line_number, sys.maxsize)) - 1
+        if index < 0 or ranges[index][1] < lex_item.line_number:
+            return
     sys.stderr.write("warning >>> %s:%d:%d:%s\n" %
                      (common.source_file_name, lex_item.line_number, lex_item.col_number, text))
 
@@ -47,29 +60,115 @@ gaps = {
 
 
 # -----------------------------------------------------------------------------
+# The gaps table expanded into a kind code x kind code matrix, built once, so
+# that gap_table[prev code][code] is the gap string itself. The strings are
+# interned so each distinct gap exists just once.
 #
-def lex_gap(a, b):
-    """ Returns the required gap between two lexical kinds. 
-    """
-    if (a, b) in gaps:
-        gap = gaps[(a, b)]
+def _build_gap_table():
+    # The gaps keyed by code, so as to avoid hashing enum members, which is
+    # slow enough to be noticed at start up. The most specific key applies.
+    #
+    def code(kind):
+        return kind if kind is Any else kind.value
+
+    code_gaps = {(code(a), code(b)): gap for (a, b), gap in gaps.items()}
 
-    elif (Any, b) in gaps:
-        gap = gaps[(Any, b)]
+    def gap(a, b):
+        for key in ((a, b), (Any, b), (a, Any)):
+            if key in code_gaps:
+                return sys.intern(" " * code_gaps[key])
+        return " "
 
-    elif (a, Any) in gaps:
-        gap = gaps[(a, Any)]
+    codes = range(len(kind_of_code))
+    return tuple(tuple(gap(a, b) for b in codes) for a in codes)
 
-    else:
-        gap = 1
 
-    return " " * gap
+gap_table = _build_gap_table()
+
+
+# -----------------------------------------------------------------------------
+# The formatter's state machine: the current mode, i.e. the kind of top level
+# definition being formatted, and the state, i.e. what the next identifier or
+# string is expected to be.
+#
+modes = OrderedEnum("modes",
+                    ("Void", "Record_Type_Spec", "Record_Spec"))
+
+states = OrderedEnum("states",
+                     ("Void", "Record_Name", "Field_Name", "Field_Value"))
+
+
+# -----------------------------------------------------------------------------
+# Per kind code action table, built once, used to dispatch the phase 3 layout
+# processing of each lexical item.
+#
+Act_None = 0         # no special action, e.g. punctuation and numbers
+Act_Identifier = 1   # field name and value state machine transitions
+Act_String = 2       # field value state machine transition
+Act_Field = 3        # field or info - start of a field
+Act_Comment = 4      # comment block or end of line comment
+Act_Open_Brace = 5   # indent
+Act_Close_Brace = 6  # outdent on a new line
+Act_Macro = 7        # honour new line
+Act_Record = 8       # record or grecord, starts a record spec
+Act_Record_Type = 9  # recordtype, starts a record type spec
+Act_New_Line = 10    # any other reserved word, starts a new line
+
+_kind_actions = {
+    lex_kinds.Lk_Identifier:   Act_Identifier,
+    lex_kinds.Lk_String:       Act_String,
+    lex_kinds.Rw_Field:        Act_Field,
+    lex_kinds.Rw_Info:         Act_Field,
+    lex_kinds.Lk_Comment:      Act_Comment,
+    lex_kinds.Lk_Open_Brace:   Act_Open_Brace,
+    lex_kinds.Lk_Close_Brace:  Act_Close_Brace,
+    lex_kinds.Lk_Macro:        Act_Macro,
+    lex_kinds.Rw_Record:       Act_Record,
+    lex_kinds.Rw_Grecord:      Act_Record,
+    lex_kinds.Rw_Record_Type:  Act_Record_Type
+}
+
+action_table = tuple(_kind_actions.get(kind,
+                                       Act_New_Line if kind is not None and
+                                       kind >= lex_kinds.Rw_Alias else Act_None)
+                     for kind in kind_of_code)
+
+# Kind codes after which the current line is always ended.
+#
+ends_line_table = tuple(kind in (lex_kinds.Lk_Comment,
+                                 lex_kinds.Lk_Open_Brace,
+                                 lex_kinds.Lk_Close_Brace)
+                        for kind in kind_of_code)
+
+# State transitions on an identifier or string, indexed by the current state.
+# The value is the (next state, align to the field value column) pair.
+#
+identifier_transitions = {
+    states.Field_Name:  (states.Field_Value, False),
+    states.Field_Value: (states.Void, True)
+}
+
+string_transitions = {
+    states.Field_Value: (states.Void, True)
+}
 
 
 # -----------------------------------------------------------------------------
 #
-def process(source, target):
+# The layout phase generates line records, one per output line. Each is an
+# (indent, parts) tuple: the number of leading spaces, and a list alternating
+# item values and the gaps that precede the next item, i.e. [value, gap, value,
+# gap, value ...]. Any padding to a column, e.g. for end of line comments, is
+# included in the gap. A blank line is (0, []). The render phase turns these
+# into text, one whole line per write.
+#
+def layout(source, stats=None, first_line=1):
     """ Main tidy functionality here. 
+        The source is either a lex_file or a token_buffer.
+        If stats, a file_stats, is specified, the output lines, records and
+        warnings are counted.
+        The first_line is the line number, as used for warnings, of the first
+        line of the source, which may be just part of a file.
     """
 
     rw_field_indent = 4
@@ -81,22 +180,25 @@ def process(source, target):
     #
     meta = "#!!"
 
-    modes = OrderedEnum("modes",
-                        ("Void", "Record_Type_Spec", "Record_Spec"))
-
-    states = OrderedEnum("states",
-                         ("Void", "Record_Name", "Field_Name", "Field_Value"))
-
     is_new_line = True
     line_length = 0
+    line_indent = 0
+    parts = []
+    ready = []
 
     def new_line():
         nonlocal is_new_line
         nonlocal line_length
+        nonlocal line_indent
+        nonlocal parts
 
-        target.write('\n')
+        ready.append((line_indent, parts))
+        parts = []
+        line_indent = 0
         line_length = 0
         is_new_line = True
+        if stats is not None:
+            stats.lines_out += 1
 
     do_new_line = False
     do_blank_line = False
@@ -110,30 +212,42 @@ def process(source, target):
     is_new_line = True
     line_length = 0
 
-    prev_item = lex_items(lex_kinds.Lk_Void, "", 1, 1)
+    # The source provides plain (kind code, value, line, col) tuples, either
+    # from a lex_file or a token_buffer. All kind tests are integer tests.
+    #
+    items = source.tokens()
+    if first_line != 1:
+        shift = first_line - 1
+        items = ((code, value, line + shift, col) for code, value, line, col in items)
+
+    prev_kind = lex_codes.Lk_Void
+    prev_line_number = first_line
 
-    lex_item = source.get_next_lexical_item()
+    lex_item = next(items, None)
 #   print(lex_item)
-    
-    while lex_item.kind != lex_kinds.Lk_End_Of_File:
 
-        # Allow peek at next item - currently not used
-        #
-        next_item = source.get_next_lexical_item()
+    while lex_item is not None:
+
+        kind, value, line_number, col_number = lex_item
 
         # Pre-processing of lexical item - phase 1
         #
-        if lex_item.kind == lex_kinds.Lk_Identifier:
+        if kind == lex_codes.Lk_Identifier:
             if state == states.Field_Name:
-                if lex_item.value != lex_item.value.upper():
-                    warning(lex_item, "field name not upper case: %s" % lex_item.value)
+                if value != value.upper():
+                    if stats is not None:
+                        stats.warnings += 1
+                    warning(lex_items(kind_of_code[kind], value, line_number, col_number),
+                            "field name not upper case: %s" % value)
 
-                if len(lex_item.value) < 1 or len(lex_item.value) > 4:
-                    warning(lex_item, "field name too long or empty: %s" % lex_item.value)
+                if len(value) < 1 or len(value) > 4:
+                    if stats is not None:
+                        stats.warnings += 1
+                    warning(lex_items(kind_of_code[kind], value, line_number, col_number),
+                            "field name too long or empty: %s" % value)
 
-        elif lex_item.kind >= lex_kinds.Rw_Alias and lex_item.kind <= lex_kinds.Rw_Special:
-            lex_item = lex_items(lex_item.kind, lex_item.value.lower(),
-                                 lex_item.line_number, lex_item.col_number)
+        elif lex_codes.Rw_Alias <= kind <= lex_codes.Rw_Special:
+            value = value.lower()
 
         # Pre-processing of lexical item - phase 2
         #
@@ -144,56 +258,78 @@ def process(source, target):
         # If input file has at least one blank line
         # then preserve line.
         #
-        if lex_item.line_number > prev_item.line_number + 1:
+        if line_number > prev_line_number + 1:
             do_blank_line = True
 
         # Pre-processing of lexical item - phase 3
         #
-        if lex_item.kind == lex_kinds.Lk_Comment:
+        action = action_table[kind]
+
+        if action == Act_None:
+            pass
+
+        elif action == Act_Identifier:
+            # state machine change.
+            #
+            if state in identifier_transitions:
+                state, align = identifier_transitions[state]
+                if align:
+                    offset = field_value_indent - indent
+
+        elif action == Act_String:
+            # state machine change.
+            #
+            if state in string_transitions:
+                state, align = string_transitions[state]
+                if align:
+                    offset = field_value_indent - indent
+
+        elif action == Act_Field:
+            if mode == modes.Record_Type_Spec and not comment_block:
+                do_blank_line = True
+            else:
+                # Honor same line for preceeding macro
+                #
+                if prev_kind != lex_codes.Lk_Macro or \
+                   line_number > prev_line_number:
+                    do_new_line = True
+
+            # Next name (identifier) is field name.
+            #
+            state = states.Field_Name
+
+        elif action == Act_Comment:
             if not comment_block:
                 # check for end of line comment.
                 #
-                if lex_item.line_number == prev_item.line_number:
+                if line_number == prev_line_number:
                     offset = same_line_comment - indent
                 else:
                     do_blank_line = True
 
             # Do a special for the meta comments
             #
-            if lex_item.value.startswith(meta):
+            if value.startswith(meta):
                 offset = -indent
 
-        elif lex_item.kind == lex_kinds.Lk_Open_Brace:
+        elif action == Act_Open_Brace:
             indent += rw_field_indent
 
-        elif lex_item.kind == lex_kinds.Lk_Close_Brace:
+        elif action == Act_Close_Brace:
             do_new_line = True
             indent = max(0, indent - rw_field_indent)
 
-        elif lex_item.kind == lex_kinds.Lk_Identifier:
-            # state machine change.
-            #
-            if state == states.Field_Name:
-                state = states.Field_Value
-            elif state == states.Field_Value:
-                offset = field_value_indent - indent
-                state = states.Void
-
-        elif lex_item.kind == lex_kinds.Lk_String:
-            # state machine change.
-            #
-            if state == states.Field_Value:
-                offset = field_value_indent - indent
-                state = states.Void
-
-        elif lex_item.kind == lex_kinds.Lk_Macro:
+        elif action == Act_Macro:
             # honour new line.
             #
-            if lex_item.line_number > prev_item.line_number:
+            if line_number > prev_line_number:
                 do_new_line = True
                 offset = -indent
 
-        elif lex_item.kind in (lex_kinds.Rw_Record, lex_kinds.Rw_Grecord):
+        elif action == Act_Record:
+            if stats is not None:
+                stats.records += 1
+
             if not comment_block:
                 do_blank_line = True
 
@@ -201,12 +337,7 @@ def process(source, target):
             state = states.Record_Name
             mode = modes.Record_Spec
 
-        elif lex_item.kind in (lex_kinds.Rw_Alias, lex_kinds.Rw_Device,
-                               lex_kinds.Rw_Driver, lex_kinds.Rw_Function,
-                               lex_kinds.Rw_Registrar, lex_kinds.Rw_Variable):
-            do_new_line = True
-
-        elif lex_item.kind == lex_kinds.Rw_Record_Type:
+        elif action == Act_Record_Type:
             if not comment_block:
                 do_blank_line = True
 
@@ -214,26 +345,7 @@ def process(source, target):
             state = states.Record_Name
             mode = modes.Record_Type_Spec
 
-        elif lex_item.kind in (lex_kinds.Rw_Field, lex_kinds.Rw_Info):
-            if mode == modes.Record_Type_Spec and not comment_block:
-                do_blank_line = True
-            else:
-                # Honor same line for preceeding macro
-                #
-                if prev_item.kind != lex_kinds.Lk_Macro or \
-                   lex_item.line_number > prev_item.line_number:
-                    do_new_line = True
-
-            # Next name (identifier) is field name.
-            #
-            state = states.Field_Name
-
-        elif lex_item.kind in (lex_kinds.Rw_Asl, lex_kinds.Rw_Choice,
-                               lex_kinds.Rw_Extra, lex_kinds.Rw_Include,
-                               lex_kinds.Rw_Initial, lex_kinds.Rw_Interest,
-                               lex_kinds.Rw_Menu, lex_kinds.Rw_Pp,
-                               lex_kinds.Rw_Prompt, lex_kinds.Rw_Prompt_Group,
-                               lex_kinds.Rw_Size, lex_kinds.Rw_Special):
+        else:  # Act_New_Line
             do_new_line = True
 
         # end phase 3
@@ -250,54 +362,393 @@ def process(source, target):
                 new_line()
 
         if is_new_line:
-            temp = max(0, indent + offset)
-            target.write(' ' * temp)
-            line_length = temp
+            line_indent = max(0, indent + offset)
+            line_length = line_indent
 
         else:
-            gap = lex_gap(prev_item.kind, lex_item.kind)
-            target.write(gap)
+            gap = gap_table[prev_kind][kind]
             line_length += len(gap)
 
             if indent + offset > line_length:
-                temp = indent + offset - line_length
-                target.write(' ' * temp)
-                line_length += temp
+                gap += ' ' * (indent + offset - line_length)
+                line_length = indent + offset
+
+            parts.append(gap)
 
         # Output the lexical item.
         #
-        target.write(lex_item.value)
-        line_length += len(lex_item.value)
+        parts.append(value)
+        line_length += len(value)
         is_new_line = False
 
         # post-processing of lexical item.
         #
-        comment_block = False
+        comment_block = kind == lex_codes.Lk_Comment
 
-        if lex_item.kind == lex_kinds.Lk_Comment:
+        if ends_line_table[kind]:
             new_line()
-            comment_block = True
 
-        elif lex_item.kind in (lex_kinds.Lk_Open_Brace, lex_kinds.Lk_Close_Brace):
-            new_line()
+        # Pass on any completed lines.
+        #
+        if ready:
+            yield from ready
+            ready.clear()
 
         # update for next iteration
         #
-        prev_item = lex_item
-        lex_item = next_item
+        prev_kind = kind
+        prev_line_number = line_number
+
+        # There is no look ahead: the next item is only read once any completed
+        # lines have been passed on, so that when streaming, e.g. from a pipe,
+        # each line is output before any more input is required.
+        #
+        lex_item = next(items, None)
 #       print(lex_item)
 
     if not is_new_line:
         new_line()
 
+    yield from ready
+
+
+# -----------------------------------------------------------------------------
+#
+def render_line(line):
+    """ Returns the text of a line record, including the new line.
+    """
+    indent, parts = line
+    return ' ' * indent + ''.join(parts) + '\n'
+
+
+def render(lines, target):
+    """ Writes the line records to target, one whole line per write.
+    """
+    write = target.write
+    for line in lines:
+        write(render_line(line))
+
 
 # -----------------------------------------------------------------------------
 #
-def process_file(source_filename, target_filename):
+def process(source, target, stats=None, names=None, schema=None):
+    """ Tidies the source, either a lex_file or a token_buffer, and writes the
+        output to target. If stats, a file_stats, is specified, the output
+        lines, records and warnings are counted. If names, a name_collector,
+        is specified, the declared record and alias names are collected.
+        If schema, a record_schema, is specified, the record types and field
+        names are checked against it.
+    """
+    render(layout(observe(source, stats, names, schema), stats), target)
+
+
+def observe(source, stats=None, names=None, schema=None):
+    """ Returns the source with the names collector, and a checker for the
+        schema, if specified, attached, each observing the tokens as they are
+        passed on. Otherwise returns source as is.
+    """
+    if names is not None:
+        source = names.attach(source)
+    if schema is not None:
+        source = schema.checker(stats).attach(source)
+    return source
+
+
+# -----------------------------------------------------------------------------
+#
+def lex_source(source, stats=None):
+    """ Returns source, a lex_file, unless stats is specified, when source is
+        read into a token_buffer, which is returned, so that the lex and format
+        times may be measured separately, and the tokens counted.
+    """
+    if stats is None:
+        return source
+
+    start = time.perf_counter()
+    tokens = source.get_token_buffer()
+    stats.lex_time += time.perf_counter() - start
+    stats.lexed = True
+    return tokens
+
+
+def process_source(source, target, stats=None, names=None, schema=None):
+    """ As per process, but when stats is specified, the source lex_file is
+        read into a token_buffer first, see lex_source.
+    """
+    tokens = lex_source(source, stats)
+
+    start = time.perf_counter()
+    process(tokens, target, stats, names, schema)
+    if stats is not None:
+        stats.format_time += time.perf_counter() - start
+
+
+# -----------------------------------------------------------------------------
+#
+def process_file(source_filename, target_filename, bulk=False, stats=None, binary=False):
     """ Handles file opening/closeing
+        When bulk is True, the source file is read in one go as opposed to
+        line by line. When binary is True, both files are read and written
+        in byte mode, see lex_file.
     """
-    with lex_file(source_filename) as source:
-        with open(target_filename, 'w') as target:
-            process(source, target)
+    with lex_file(source_filename, bulk, stats=stats, binary=binary) as source:
+        if binary:
+            target = open(target_filename, 'w', encoding=lexer.byte_encoding, newline='\n')
+        else:
+            target = open(target_filename, 'w')
+        with target:
+            process_source(source, target, stats)
+
+
+def data_stream(data, binary=False):
+    """ Returns a text stream that reads data (bytes) as per opening a file in
+        text mode or, if binary, in byte mode.
+    """
+    if binary:
+        return lexer.byte_stream(data)
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+# -----------------------------------------------------------------------------
+#
+def process_data(filename, data, bulk=False, stats=None, names=None, schema=None,
+                 binary=False):
+    """ Tidies data, the entire content of filename (as bytes), and returns
+        the content, again as bytes, that process_file would write. Encoding
+        and new line translation are as per opening the file in text mode or,
+        if binary, byte mode, in which any bytes other than ASCII are passed
+        through unchanged, and no decode errors are possible. Only '\n' ends
+        a line in byte mode, but a '\r' at the end of a line is removed as
+        white space, so CRLF line endings become LF.
+    """
+    stream = data_stream(data, binary)
+    target = io.StringIO()
+    with lex_file(filename, bulk, stream, stats, binary) as source:
+        process_source(source, target, stats, names, schema)
+
+    text = target.getvalue()
+    if os.linesep != '\n' and not binary:
+        text = text.replace('\n', os.linesep)
+    return text.encode(stream.encoding)
+
+
+# -----------------------------------------------------------------------------
+#
+def collect_names(filename, data, names, binary=False):
+    """ Collects the declared names from data (bytes), the content of filename,
+        into names, a name_collector, without formatting.
+    """
+    with lex_file(filename, True, data_stream(data, binary), binary=binary) as source:
+        for item in names.attach(source).tokens():
+            pass
+
+
+# -----------------------------------------------------------------------------
+# In memory interface.
+#
+def tidy_stream(reader, writer, filename="<stream>", bulk=False, stats=None):
+    """ Tidies the text read from reader, any text file like object, writing
+        the tidy text to writer. The filename is only used for warnings.
+        If stats, a file_stats, is specified, it is updated.
+    """
+    common.source_file_name = filename
+    with lex_file(filename, bulk, reader, stats) as source:
+        process_source(source, writer, stats)
+
+
+# A top level record, recordtype etc. ends with this line.
+#
+record_end_line = (0, ['}'])
+
+
+def tidy_filter(reader, writer, filename="<stdin>", stats=None, binary=False):
+    """ As per tidy_stream, but the reader is always read line by line, and
+        the writer is flushed after each top level record (or recordtype etc.)
+        so that, in a pipeline, memory use is constant regardless of the size
+        of the input, and each record is passed on as soon as it is tidy.
+        If binary, the reader is read in byte mode, see lex_file.
+    """
+    common.source_file_name = filename
+    write = writer.write
+    with lex_file(filename, False, reader, stats, binary) as source:
+        for line in layout(source, stats):
+            write(render_line(line))
+            if line == record_end_line:
+                writer.flush()
+        if stats is not None:
+            stats.lines_in += source.line_number - 1
+    writer.flush()
+
+
+def tidy_text(text, filename="<text>", stats=None):
+    """ Returns the tidy form of text. Any \\r\\n or \\r line ending is
+        read as \\n, as per reading a file in text mode.
+    """
+    target = io.StringIO()
+    tidy_stream(io.StringIO(text, newline=None), target, filename, True, stats)
+    return target.getvalue()
+
+
+def tidy_bytes(data, encoding=None, filename="<bytes>"):
+    """ Returns the tidy form of data (bytes), using the given encoding, or
+        if None, the locale's preferred encoding as used for files.
+    """
+    encoding = encoding or locale.getpreferredencoding(False)
+    return tidy_text(data.decode(encoding), filename).encode(encoding)
+
+
+# -----------------------------------------------------------------------------
+# Range formatting.
+#
+# Only the top level records, grecords and recordtypes enclosing the range are
+# formatted. Each starts on its own line at zero indent, in a known mode and
+# state, so formatting may start afresh at such a line. All other lines are
+# left exactly as is.
+#
+_record_start = re.compile(r"[ \t]*(g?record|recordtype)[ \t]*(\(|$)", re.IGNORECASE)
+
+
+def range_bounds(lines, first, last):
+    """ Returns the (start, end) indices of the slice of lines (each including
+        its new line) to be formatted for the line range first to last (line
+        numbers, inclusive). This is widened to start at the enclosing record,
+        grecord or recordtype line, or the first line, and to end just before
+        the next one, or the end, excluding any trailing blank lines. An empty
+        slice indicates there is nothing to format.
+    """
+    count = len(lines)
+    if first > count or last < first:
+        return count, count
+
+    start = max(first, 1) - 1
+    end = min(last, count)
+
+    while start > 0 and not _record_start.match(lines[start]):
+        start -= 1
+
+    while end < count and not _record_start.match(lines[end]):
+        end += 1
+
+    while end > start and lines[end - 1].strip() == '':
+        end -= 1
+
+    return start, end
+
+
+def tidy_range(text, first, last, filename="<text>", stats=None, binary=False):
+    """ Returns text with just the records (or recordtypes) enclosing lines
+        first to last (line numbers, inclusive) tidied, see range_bounds.
+        The new lines of the tidied part are those of its first line, all
+        other text is unchanged. If binary, text is that of byte mode.
+    """
+    common.source_file_name = filename
+
+    # In byte mode only '\n' ends a line, and any '\r' is passed through.
+    #
+    newline = '\n' if binary else None
+    lines = io.StringIO(text, newline='\n' if binary else '').readlines()
+    start, end = range_bounds(lines, first, last)
+    if start >= end:
+        return text
+
+    new_line = '\n'
+    for line in lines[start:end]:
+        if line.endswith(('\n', '\r')):
+            new_line = line[len(line.rstrip('\r\n')):]
+            break
+
+    target = io.StringIO()
+    part = io.StringIO(''.join(lines[start:end]), newline=newline)
+    with lex_file(filename, True, part, stats, binary) as source:
+        tokens = lex_source(source, stats)
+        format_start = time.perf_counter()
+        render(layout(tokens, stats, start + 1), target)
+        if stats is not None:
+            stats.format_time += time.perf_counter() - format_start
+
+    tidy = target.getvalue()
+    if new_line != '\n':
+        tidy = tidy.replace('\n', new_line)
+
+    return ''.join(lines[:start]) + tidy + ''.join(lines[end:])
+
+
+def process_range_data(filename, data, first, last, stats=None, binary=False):
+    """ As per process_data, but returns data (bytes) with just the lines first
+        to last tidied, as per tidy_range.
+    """
+    encoding = data_stream(data, binary).encoding
+    text = data.decode(encoding)
+    return tidy_range(text, first, last, filename, stats, binary).encode(encoding)
+
+
+class DifferenceFound (Exception):
+    """ Raised by a check_target on the first difference.
+    """
+    pass
+
+
+class check_target (object):
+    """ A write only text target which, rather than storing the text written,
+        compares it as it goes with the expected text, i.e. the current file
+        content. Raises DifferenceFound at the first difference. New lines are
+        written as os.linesep, unless binary.
+    """
+    def __init__(self, expected, binary=False):
+        self.expected = expected
+        self.position = 0
+        self.translate = os.linesep != '\n' and not binary
+
+    def write(self, text):
+        if self.translate:
+            text = text.replace('\n', os.linesep)
+        if not self.expected.startswith(text, self.position):
+            raise DifferenceFound()
+        self.position += len(text)
+
+    def finish(self):
+        """ Checks that all the expected text has been written.
+        """
+        if self.position != len(self.expected):
+            raise DifferenceFound()
+
+
+# -----------------------------------------------------------------------------
+#
+def check_data(filename, data, bulk=False, names=None, schema=None, binary=False,
+               stats=None):
+    """ Returns True if process_data would return data unchanged. This stops
+        at the first difference, and never holds the entire tidy output,
+        though if names or schema is specified, all the names are still
+        collected, and all the records are still checked. Content that cannot
+        be decoded raises UnicodeDecodeError, as per process_data.
+        If stats is specified, the whole of data is lexed, see lex_source,
+        but the format time and output counts are to the first difference.
+    """
+    stream = data_stream(data, binary)
+    expected = data.decode(stream.encoding)
+
+    target = check_target(expected, binary)
+    try:
+        with lex_file(filename, bulk, stream, stats, binary) as source:
+            tokens = lex_source(source, stats)
+            start = time.perf_counter()
+            observed = observe(tokens, stats, names, schema)
+            try:
+                process(observed, target, stats)
+            except DifferenceFound:
+                # Let the observers see the remaining tokens.
+                #
+                if observed is not tokens:
+                    for item in observed.tokens():
+                        pass
+                raise
+            finally:
+                if stats is not None:
+                    stats.format_time += time.perf_counter() - start
+        target.finish()
+    except DifferenceFound:
+        return False
+    return True
 
 # end
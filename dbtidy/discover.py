@@ -0,0 +1,75 @@
+""" This module finds the files to be tidied, walking any directories given
+    on the command line.
+"""
+
+import fnmatch
+import os
+import os.path
+import sys
+
+# Files selected from within directories, unless otherwise specified.
+#
+default_includes = ("*.db", "*.vdb", "*.template", "*.dbd")
+
+# Directories never walked: version control and EPICS build output.
+#
+skip_directories = (".git", ".hg", ".svn", ".bzr", "CVS", "O.*")
+
+
+def _matches(name, path, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern):
+            return True
+    return False
+
+
+def _walk(directory, includes, excludes):
+    """ Generates the selected files within directory, depth first and in name
+        order, reading only one directory at a time.
+    """
+    try:
+        with os.scandir(directory) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+    except OSError as error:
+        sys.stderr.write("cannot read directory: %s\n" % error)
+        return
+
+    for entry in entries:
+        name = entry.name
+        path = entry.path
+        if _matches(name, path, excludes):
+            continue
+
+        if entry.is_dir(follow_symlinks=False):
+            if not _matches(name, path, skip_directories):
+                yield from _walk(path, includes, excludes)
+
+        elif entry.is_file() and not name.endswith(".~"):
+            if _matches(name, path, includes):
+                yield path
+
+
+def is_selected(path, includes=None, excludes=()):
+    """ Returns True if path would be selected from within a directory, i.e.
+        it matches any of the includes patterns and none of the excludes.
+    """
+    name = os.path.basename(path)
+    includes = includes or default_includes
+    return not name.endswith(".~") and _matches(name, path, includes) and \
+        not _matches(name, path, excludes)
+
+
+def find_files(paths, includes=None, excludes=()):
+    """ Generates the files to be processed. A path that is a directory is
+        walked recursively for files matching any of the includes patterns and
+        none of the excludes patterns. Any other path is generated as is.
+        Patterns match either the file name or the whole path, using fnmatch.
+    """
+    includes = includes or default_includes
+    for path in paths:
+        if os.path.isdir(path):
+            yield from _walk(path, includes, excludes)
+        else:
+            yield path
+
+# end
@@ -0,0 +1,125 @@
+""" This module asks the local git repository which files, and which lines of
+    those files, have changed, so that only those need be tidied.
+"""
+
+import os
+import os.path
+import re
+import subprocess
+
+
+class git_error (Exception):
+    """ Raised if git fails, e.g. when not within a git repository.
+    """
+    pass
+
+
+# The new file part of a unified diff hunk header, e.g. @@ -10,2 +12,3 @@
+#
+_hunk = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# A C style escape within a quoted path name, e.g. \303 or \".
+#
+_escape = re.compile(r'\\([0-7]{3}|.)')
+_escapes = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13}
+
+
+def unquote_path(name):
+    """ Returns the path name as given by git diff, which quotes any name that
+        contains e.g. a double quote, a control character or, by default, any
+        character other than ASCII, as a C string, e.g. "caf\303\251.db".
+    """
+    if len(name) < 2 or not (name.startswith('"') and name.endswith('"')):
+        return name
+
+    def byte(match):
+        code = match.group(1)
+        if len(code) == 3:
+            return bytes([int(code, 8)])
+        if code in _escapes:
+            return bytes([_escapes[code]])
+        return code.encode("utf-8", "surrogateescape")
+
+    result = bytearray()
+    position = 1
+    for match in _escape.finditer(name, 1, len(name) - 1):
+        result += name[position:match.start()].encode("utf-8", "surrogateescape")
+        result += byte(match)
+        position = match.end()
+    result += name[position:-1].encode("utf-8", "surrogateescape")
+    return result.decode("utf-8", "surrogateescape")
+
+
+def run_git(args, cwd=None):
+    """ Runs git with args, and returns the standard output as text.
+    """
+    try:
+        result = subprocess.run(["git"] + args, cwd=cwd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    except OSError as error:
+        raise git_error("cannot run git: %s" % error)
+
+    if result.returncode != 0:
+        raise git_error(result.stderr.decode(errors="replace").strip())
+    return result.stdout.decode("utf-8", "surrogateescape")
+
+
+def diff_args(since=None, staged=False):
+    """ Returns the git diff arguments selecting the changes: those staged for
+        commit if staged, otherwise those in the working tree relative to the
+        commit since (or HEAD).
+    """
+    if staged:
+        return ["diff", "--cached"]
+    return ["diff", since or "HEAD"]
+
+
+def changed_files(since=None, staged=False, pathspecs=()):
+    """ Returns the sorted list of absolute paths of the files added, copied,
+        modified or renamed, as per diff_args, limited to pathspecs if any.
+    """
+    top = run_git(["rev-parse", "--show-toplevel"]).rstrip("\n")
+    output = run_git(diff_args(since, staged) +
+                     ["--name-only", "--diff-filter=ACMR", "-z", "--"] + list(pathspecs))
+    return sorted(os.path.join(top, name) for name in output.split("\0") if name)
+
+
+def changed_lines(since=None, staged=False, pathspecs=()):
+    """ Returns a dict of each changed file's absolute path to the sorted list
+        of the (first, last) line ranges added or changed, as per diff_args.
+        A pure deletion is given as the range of the line following it.
+        The file name prefixes are set explicitly, as they may otherwise be
+        changed by the user's configuration, e.g. diff.noprefix.
+    """
+    top = run_git(["rev-parse", "--show-toplevel"]).rstrip("\n")
+    output = run_git(diff_args(since, staged) +
+                     ["--unified=0", "--no-color", "--no-ext-diff", "--diff-filter=ACMR",
+                      "--src-prefix=a/", "--dst-prefix=b/", "--"] + list(pathspecs))
+    result = {}
+    ranges = None
+    for line in output.split("\n"):
+        if line.startswith("+++ "):
+            # Git ends the name with a tab if it contains a space.
+            #
+            name = line[4:]
+            if name.endswith("\t"):
+                name = name[:-1]
+            name = unquote_path(name)
+            if name.startswith("b/"):
+                ranges = result.setdefault(os.path.join(top, name[2:]), [])
+            else:
+                ranges = None
+
+        elif line.startswith("@@") and ranges is not None:
+            match = _hunk.match(line)
+            if match:
+                first = int(match.group(1))
+                count = int(match.group(2) or "1")
+                ranges.append((max(first, 1), first + max(count, 1) - 1))
+
+    for ranges in result.values():
+        ranges.sort()
+    return result
+
+
+# end
@@ -0,0 +1,129 @@
+""" This module provides overlapped file I/O: a small pool of threads reads
+    the upcoming files, and backs up and writes the tidied files, while the
+    formatting proceeds on the main thread. This hides storage latency, e.g.
+    on network file systems, even when there is only one CPU.
+"""
+
+import collections
+import concurrent.futures
+import threading
+
+# The type of the results of io_pipeline.write.
+#
+future_type = concurrent.futures.Future
+
+
+def parse_size(text):
+    """ Converts e.g. "64M" to 64 * 1024 * 1024, or "1.5K" to 1536. Returns
+        None if invalid.
+    """
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    multiplier = multipliers.get(text[-1:], 1)
+    if text[-1:] in multipliers:
+        text = text[:-1]
+    if not text.replace(".", "", 1).isdigit():
+        return None
+    return int(float(text) * multiplier)
+
+
+# -----------------------------------------------------------------------------
+#
+class io_pipeline (object):
+    """ Runs file reads and writes on a pool of threads threads. No new read
+        is started while the bytes held, i.e. read but not yet formatted, or
+        waiting to be written, reach limit. So the bound may be exceeded by at
+        most the reads already in progress.
+    """
+
+    def __init__(self, threads=2, limit=64 * 1024 * 1024):
+        self.threads = max(1, threads)
+        self.limit = limit
+        self.held = 0
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """ Waits for any outstanding writes to complete.
+        """
+        self.executor.shutdown(wait=True)
+
+
+    def hold(self, size):
+        with self.lock:
+            self.held += size
+
+
+    def read(self, read_function, filename, known):
+        """ Calls read_function(filename, known), which returns a tuple whose
+            second item is the data read, or None.
+        """
+        result = read_function(filename, known)
+        if result[1] is not None:
+            self.hold(len(result[1]))
+        return result
+
+
+    def prefetch(self, filenames, lookup, read_function):
+        """ Generates (filename, known, future) for each of filenames, where
+            known is lookup(filename), and the future's result is that of
+            read_function(filename, known). Up to twice the number of threads
+            files are read ahead, subject to the held bytes limit, though at least
+            the next file is always read. The data is no longer held once the
+            consumer asks for the next file.
+        """
+        ahead = collections.deque()
+        filenames = iter(filenames)
+        more = True
+
+        while True:
+            while more and len(ahead) < 2 * self.threads and \
+                    (not ahead or self.held < self.limit):
+                filename = next(filenames, None)
+                if filename is None:
+                    more = False
+                    break
+
+                known = lookup(filename)
+                ahead.append((filename, known,
+                              self.executor.submit(self.read, read_function,
+                                                   filename, known)))
+
+            if not ahead:
+                return
+
+            filename, known, future = ahead.popleft()
+            yield filename, known, future
+
+            # The consumer is done with this file's data.
+            #
+            if not future.exception():
+                data = future.result()[1]
+                if data is not None:
+                    self.hold(-len(data))
+
+
+    def write(self, write_function, data, *args):
+        """ Calls write_function(*args) in the background, holding the bytes of
+            data, the content being written, until done. Returns the future.
+        """
+        self.hold(len(data))
+
+        def run():
+            try:
+                return write_function(*args)
+            finally:
+                self.hold(-len(data))
+
+        return self.executor.submit(run)
+
+# end
@@ -2,6 +2,12 @@
     allws the reading of lexical items (as opposed to lines etc.)
 """
 
+import io
+import mmap
+import os
+import re
+import stat
+from array import array
 from collections import namedtuple
 from . import ordered_enum
 from . import common
@@ -56,6 +62,13 @@ lex_values = ("Lk_Void",         # use as an initialiser, a quazi None
 
 lex_kinds = OrderedEnum("lex_kinds", lex_values)
 
+# The lex_kinds values as small plain integers, e.g. lex_codes.Lk_Comment, for
+# compact storage and cheap comparisons. kind_of_code maps a code back to the
+# corresponding lex_kinds member.
+#
+lex_codes = namedtuple("lex_codes", lex_values)(*(kind.value for kind in lex_kinds))
+kind_of_code = (None,) + tuple(lex_kinds)
+
 # Defines a lexical item
 #
 lex_items = namedtuple("lex_items", ("kind", "value", "line_number", "col_number"))
@@ -70,16 +83,254 @@ def lex_item_image(self):
 lex_items.__str__ = lex_item_image
 
 
+def unquote(value):
+    """ Returns value, the value of a string or other item, without its quotes.
+    """
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    return value
+
+
 # -----------------------------------------------------------------------------
+# The scanner is a single master regular expression, with one capturing group
+# per family of lexical items. Each match also consumes any trailing white space
+# so that the scan offset always rests on the start of the next item (or the
+# end of the line). The alternatives mirror, character class for character
+# class, the original hand coded scanner - in particular:
 #
-class lex_file (object):
+# a) a number is: digits [.] [digits] [e|E] [+|-] [digits], each part optional
+#    except the first digit, and the first digit takes priority over a letter;
+# b) an identifier is a letter followed by any letters, digits or colons;
+# c) a string ends at the first quote that is preceeded by an even number of
+#    back slashes. Note: a quote does not reset the back slash count, so the
+#    second quote in "\"" is still considered masked. An unterminated string
+#    runs to the end of the line;
+# d) a macro is $( up to and including the next ), or to the end of line.
+#
+_token_template = r"""
+    (?:
+      ( " (?: [^"\\] | \\"*[^"] )* (?: " | \\"*\Z )? )     # 1 string
+    | ( {digit}+ \.? {digit}* [eE]? [+-]? {digit}* )      # 2 number
+    | ( {alpha} {alnum}* (?: : {alnum}* )* )              # 3 identifier
+    | ( [(){{}}\[\],+-] )                                 # 4 punctuation
+    | ( \$\( [^)]* \)? )                                  # 5 macro
+    | ( \# .* )                                           # 6 comment
+    | ( . )                                               # 7 other
+    )
+    [ \t]*
+"""
+
+_group_kinds = (None,
+                lex_kinds.Lk_String,
+                lex_kinds.Lk_Number,
+                lex_kinds.Lk_Identifier,
+                None,
+                lex_kinds.Lk_Macro,
+                lex_kinds.Lk_Comment,
+                lex_kinds.Lk_Other)
+
+_punctuation_kinds = {
+    '(': lex_kinds.Lk_Open_Round,
+    ')': lex_kinds.Lk_Close_Round,
+    '[': lex_kinds.Lk_Open_Square,
+    ']': lex_kinds.Lk_Close_Square,
+    '{': lex_kinds.Lk_Open_Brace,
+    '}': lex_kinds.Lk_Close_Brace,
+    ',': lex_kinds.Lk_Comma,
+    '+': lex_kinds.Lk_Plus,
+    '-': lex_kinds.Lk_Plus
+}
+
+_group_codes = tuple(None if kind is None else kind.value for kind in _group_kinds)
+_punctuation_codes = {char: kind.value for char, kind in _punctuation_kinds.items()}
+
+_end_of_file_kind = lex_kinds.Lk_End_Of_File
+_identifier_kind = lex_kinds.Lk_Identifier
+
+_identifier_group = 3
+_punctuation_group = 4
+
+# Pure ASCII text (by far the most common case) only needs ASCII classes.
+#
+_ascii_scanner = re.compile(_token_template.format(alpha="[A-Za-z]",
+                                                   alnum="[A-Za-z0-9]",
+                                                   digit="[0-9]"),
+                            re.VERBOSE | re.DOTALL)
+
+# In byte mode, each character is a byte, read as latin-1, and any byte other
+# than ASCII is taken to be part of a word (e.g. of a multi-byte UTF-8 letter),
+# but never a digit. So the scan is independent of the encoding and locale.
+#
+_byte_scanner = re.compile(_token_template.format(alpha="[A-Za-z\x80-\xff]",
+                                                  alnum="[A-Za-z0-9\x80-\xff]",
+                                                  digit="[0-9]"),
+                           re.VERBOSE | re.DOTALL)
+
+_unicode_scanner = None
+_leading_space = re.compile(r"[ \t]*")
+_new_line = re.compile("\n")
+
+
+def _get_unicode_scanner():
+    """ Returns the scanner used for lines containing non-ASCII characters.
+        The re module has no equivalent of str.isnumeric, so the set of all
+        numeric characters is enumerated. As this takes a noticable fraction
+        of a second, it is deferred until first required.
+    """
+    global _unicode_scanner
+
+    if _unicode_scanner is None:
+        numeric = "".join(chr(c) for c in range(0x80, 0x110000)
+                          if chr(c).isnumeric())
+        digit = "[0-9%s]" % numeric
+
+        # [^\W_] is exactly str.isalnum(), i.e. isalpha() or isnumeric().
+        # Any numeric character is consumed by the number alternative first,
+        # so as a first character it only matches what isalpha() accepts.
+        #
+        _unicode_scanner = re.compile(_token_template.format(alpha=r"[^\W_]",
+                                                             alnum=r"[^\W_]",
+                                                             digit=digit),
+                                      re.VERBOSE | re.DOTALL)
+    return _unicode_scanner
+
+
+# -----------------------------------------------------------------------------
+#
+class token_buffer (object):
+    """ Holds a whole file's worth of lexical items in parallel arrays: the kind
+        codes, the start and end offsets of each item's value within text, and
+        the line and col numbers. Values are only extracted from the text when
+        requested, so this is much more compact than a list of lex_items.
+    """
+
+    __slots__ = ("text", "kinds", "starts", "ends", "lines", "cols",
+                 "eof_line_number", "eof_col_number", "cursor")
+
+    def __init__(self):
+        self.text = ""
+        self.kinds = array("B")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.lines = array("l")
+        self.cols = array("l")
+        self.eof_line_number = 1
+        self.eof_col_number = 1
+        self.cursor = 0
+
+
+    def __len__(self):
+        return len(self.kinds)
+
+
+    def value(self, index):
+        return self.text[self.starts[index]:self.ends[index]]
+
+
+    def item(self, index):
+        """ Returns the index-th item as a lex_items.
+        """
+        return lex_items(kind_of_code[self.kinds[index]], self.value(index),
+                         self.lines[index], self.cols[index])
 
-    def __init__(self, filename):
+
+    def tokens(self):
+        """ As per lex_file.tokens - generates all items as plain tuples.
+        """
+        text = self.text
+        for code, start, end, line_number, col_number in \
+                zip(self.kinds, self.starts, self.ends, self.lines, self.cols):
+            yield (code, text[start:end], line_number, col_number)
+
+
+    def get_next_lexical_item(self):
+        """ As per lex_file.get_next_lexical_item, allows a token_buffer to be
+            used in place of a lex_file.
+        """
+        index = self.cursor
+        if index >= len(self.kinds):
+            return lex_items(_end_of_file_kind, "",
+                             self.eof_line_number, self.eof_col_number)
+
+        self.cursor = index + 1
+        return self.item(index)
+
+
+# The encoding of byte mode.
+#
+byte_encoding = "latin-1"
+
+# The white space stripped from the end of each line in byte mode: ASCII only,
+# as bytes such as 0x85 and 0xa0, white space in latin-1, are also common UTF-8
+# continuation bytes, and must be passed through unchanged.
+#
+byte_space = " \t\r\n\f\v"
+
+
+def byte_stream(data):
+    """ Returns a text stream that reads data (bytes) in byte mode.
+    """
+    return io.TextIOWrapper(io.BytesIO(data), byte_encoding, newline='\n')
+
+
+# Bulk read files at least this size are memory mapped rather than read.
+#
+mmap_threshold = 16 * 1024 * 1024
+
+# Bulk read files of at least this many characters are lexed by the NumPy
+# backend, see numpy_lexer, if available. None never uses the backend.
+#
+numpy_threshold = 1024 * 1024
+
+
+# -----------------------------------------------------------------------------
+#
+class lex_file (object):
+    """ Provides the lexical items from the named file or, if specified, the
+        given text source, in which case filename is only used for messages.
+        By default the file is read line by line. In bulk mode, a regular file
+        is read (or memory mapped if large) in one go and tokenized in place,
+        with line numbers taken from a precomputed index of line start offsets.
+        Any other sort of file, e.g. a pipe, is always read line by line.
+        If stats, a file_stats, is specified then get_token_buffer counts the
+        items by kind, and the lines.
+        If binary, the file is read in byte mode: as latin-1, i.e. one byte per
+        character, with only '\n' ending a line, and scanned as per
+        _byte_scanner. A given source must be read likewise, see byte_stream.
+    """
+
+    def __init__(self, filename, bulk=False, source=None, stats=None, binary=False):
         self.filename = filename
+        self.stats = stats
+        self.binary = binary
         self.buffer = ""
+        self.position = 0
+        self.end = 0
+        self.line_start = 0
+        self.scanner = _byte_scanner if binary else _ascii_scanner
         self.line_number = 0
         self.col_number = 0
-        self.source = open(self.filename, 'r')
+        self.owns_source = source is None
+        if source is not None:
+            self.source = source
+        elif binary:
+            self.source = open(self.filename, 'r', encoding=byte_encoding, newline='\n')
+        else:
+            self.source = open(self.filename, 'r')
+
+        self.line_starts = None
+        if bulk:
+            # In memory text sources have no file number.
+            #
+            try:
+                info = os.fstat(self.source.fileno())
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                info = None
+
+            if info is None:
+                self.read_whole_file(0)
+            elif stat.S_ISREG(info.st_mode):
+                self.read_whole_file(info.st_size)
 
 
     def __enter__(self):
@@ -91,10 +342,46 @@ class lex_file (object):
 
 
     def close(self):
-        self.source.close()
+        if self.owns_source:
+            self.source.close()
+
+
+    def read_whole_file(self, size):
+        """ Reads the entire file into the buffer, and creates the line index.
+        """
+        if size >= mmap_threshold and self.owns_source:
+            # Decode directly from the mapped file, and then apply the same
+            # universal newline translation that text mode reading applies.
+            #
+            with mmap.mmap(self.source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = str(mapped, self.source.encoding, self.source.errors)
+
+            if '\r' in text and not self.binary:
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+        else:
+            text = self.source.read()
+
+        # The line starts index excludes the empty "line" following a final
+        # new line character, which readline would never return.
+        #
+        line_starts = [0]
+        line_starts.extend(match.end() for match in _new_line.finditer(text))
+        if line_starts[-1] == len(text):
+            line_starts.pop()
+
+        self.buffer = text
+        self.line_starts = line_starts
+        if not self.binary:
+            self.scanner = _ascii_scanner if text.isascii() else _get_unicode_scanner()
 
 
     def get_next_line(self):
+        """ Reads the next non-blank line and sets the position to its first
+            non white space character. Returns True at end of file.
+        """
+        if self.line_starts is not None:
+            return self.get_next_indexed_line()
+
         while True:
             # Read the next line from the file.
             #
@@ -105,206 +392,230 @@ class lex_file (object):
             if line == '':
                 # Empty string indicates end of file
                 #
-                return (True, "")
+                self.buffer = ""
+                self.position = 0
+                self.end = 0
+                return True
 
-            # Trim leading white space inc. tracking ol number.
-            #
-            while len(line) >= 1 and line[0] in (' ', '\t'):
-                line = line [1:]
-                self.col_number += 1
-                
             # Remove trailing white space, including any '\n' character
             #
-            line = line.rstrip()
-            
-            if len (line) > 0:
-                return (False, line)
+            line = line.rstrip(byte_space) if self.binary else line.rstrip()
 
+            if len(line) > 0:
+                self.buffer = line
+                self.end = len(line)
+                if not self.binary:
+                    self.scanner = _ascii_scanner if line.isascii() else _get_unicode_scanner()
 
-    def get_next_lexical_item(self):
-        """ Gets the next lexical item from the file or returns an end of file
-            indicator. Reads one or more lines form the file if needs be.
-        """
-        kind = lex_kinds.Lk_Void
-        value = ""
-        next = 0
-                
-        # Any input left in the buffer?
-        #
-        if self.buffer == "":
-            # Buffer is empty.
-            #
-            eof, self.buffer = self.get_next_line()
-            if eof:
-                kind = lex_kinds.Lk_End_Of_File
-                return lex_items(kind, value, self.line_number, self.col_number)
-
-
-        # c is first character of item, next points to following character.
-        # lex item is at least one character
-        #
-        c = self.buffer[0]
-        next = 1
-
-#       print (c, next, self.buffer)
-
-        # Oh how I would kill for a case statement
-        #
-        if c == '(':
-            kind = lex_kinds.Lk_Open_Round
-
-        elif c == ')':
-            kind = lex_kinds.Lk_Close_Round
+                # Skip leading white space inc. tracking col number.
+                #
+                self.position = _leading_space.match(line).end()
+                self.col_number = self.position + 1
+                return False
 
-        elif c == '[':
-            kind = lex_kinds.Lk_Open_Square
 
-        elif c == ']':
-            kind = lex_kinds.Lk_Close_Square
+    def get_next_indexed_line(self):
+        """ As get_next_line, but for a file held in the buffer. Here the line
+            number is the line's index into line_starts (plus one).
+        """
+        text = self.buffer
+        line_starts = self.line_starts
+        count = len(line_starts)
+        binary = self.binary
 
-        elif c == '{':
-            kind = lex_kinds.Lk_Open_Brace
+        while True:
+            index = self.line_number
+            self.line_number = index + 1
+            self.col_number = 1
 
-        elif c == '}':
-            kind = lex_kinds.Lk_Close_Brace
+            if index >= count:
+                self.position = self.end = len(text)
+                return True
 
-        elif c == ',':
-            kind = lex_kinds.Lk_Comma
+            start = line_starts[index]
+            end = line_starts[index + 1] - 1 if index + 1 < count else len(text)
 
-        elif c in ('+','-'):
-            # +/-.
+            # Remove trailing white space (as per get_next_line), and skip
+            # leading white space inc. tracking col number.
             #
-            kind = lex_kinds.Lk_Plus    
+            if binary:
+                while end > start and text[end - 1] in byte_space:
+                    end -= 1
+            else:
+                while end > start and text[end - 1].isspace():
+                    end -= 1
 
+            position = _leading_space.match(text, start, end).end()
+            if position < end:
+                self.line_start = start
+                self.position = position
+                self.end = end
+                self.col_number = position - start + 1
+                return False
 
-        elif c.isnumeric():
-            # Number
-            #
-            kind = lex_kinds.Lk_Number
-            
-            # Integer part
-            #
-            while next < len(self.buffer) and self.buffer[next].isnumeric():
-                next += 1
-                
-            if next < len(self.buffer) and self.buffer[next] == ".":
-                next += 1
-                
-            # Fractional part
-            while next < len(self.buffer) and self.buffer[next].isnumeric():
-                next += 1
-                    
-            if  next < len(self.buffer) and self.buffer[next] in ('e','E'):
-                next += 1
-
-            if  next < len(self.buffer) and self.buffer[next] in ('+','-'):
-                next += 1
-
-            # Exponent part
-            while next < len(self.buffer) and self.buffer[next].isnumeric():
-                next += 1
-                
-
-        elif c.isalpha():
-            # identifier or reserved word.
-            #
-            while next < len(self.buffer) and \
-                    self.is_identifier_char(self.buffer[next]):
-                next += 1
-
-            value = self.buffer[0:next]
-            kind = self.is_resererved_word(value)
-            if kind is None:
-                kind = lex_kinds.Lk_Identifier
-
-        elif c == '"':
-            # quote
-            kind = lex_kinds.Lk_String
-
-            # A string is of the form "", "XXXX", or "XXX\"XXX"
-            # Two quotes "" in a string are NOT interpreted as a single
-            # quote by dbLoadRecord.
-            #
-            back_slash_count = 0
-            while True:
-                if next >= len(self.buffer):
-                    break
-
-                d = self.buffer[next]
-                if d == '\\':
-                    back_slash_count = (back_slash_count + 1) % 2
-                elif d != '"':
-                    back_slash_count = 0
-
-                # Advance
-                #
-                next += 1
 
-                # Was previous charactcer a quote?
-                #
-                if d == '"':
-                    # Yes - posible end of line.
-                    #
-                    if back_slash_count == 0:
-                        # All done if not masked, i.e. even number of \\.
-                        #
-                        break
-
-        elif c == '$':
-            # Macro  $(XXX)
-            # TODO: Macro with default, $(XXX=YYY)
+    def get_next_lexical_item(self):
+        """ Gets the next lexical item from the file or returns an end of file
+            indicator. Reads one or more lines form the file if needs be.
+        """
+        # Any input left in the buffer?
+        #
+        if self.position >= self.end:
+            # Buffer is empty.
             #
-            if next < len(self.buffer) and self.buffer[next] == '(':
-                kind = lex_kinds.Lk_Macro
-
-                next += 1   # skip the (
+            if self.get_next_line():
+                return lex_items(_end_of_file_kind, "",
+                                 self.line_number, self.col_number)
 
-                while next < len(self.buffer) and self.buffer[next] != ')':
-                    next += 1
+        # Match the item and any trailing white space. We never slice the buffer
+        # other than to extract the item value itself.
+        #
+        match = self.scanner.match(self.buffer, self.position, self.end)
+        group = match.lastindex
+        value = match.group(group)
 
-                next += 1   # skip the )
+        if group == _identifier_group:
+            kind = reserved_words.get(value.lower(), _identifier_kind)
 
-            else:
-                kind = lex_kinds.Lk_Other
-
-        elif c == '#':
-            kind = lex_kinds.Lk_Comment
-            next = len(self.buffer)
+        elif group == _punctuation_group:
+            kind = _punctuation_kinds[value]
 
         else:
-            # some unexpected arbitary character.
-            #
-            kind = lex_kinds.Lk_Other
+            kind = _group_kinds[group]
 
+        result = lex_items(kind, value, self.line_number,
+                           self.position - self.line_start + 1)
 
-        value = self.buffer[0:next]
-        result = lex_items(kind, value, self.line_number, self.col_number)
+        self.position = match.end()
+        self.col_number = self.position - self.line_start + 1
+        return result
 
-        # Remove the value from the buffer.
-        #
-        self.buffer = self.buffer[next:]
-        self.col_number += next
 
-        # Trim any white space
-        #
-        while len(self.buffer) >= 1 and self.buffer[0] in (' ', '\t'):
-            self.buffer = self.buffer [1:]
-            self.col_number += 1
-        
+    def tokens(self):
+        """ Generates the remaining lexical items as plain tuples of
+            (kind code, value, line number, col number), excluding the end of
+            file item. This avoids the cost of creating a lex_items per item.
+            Do not mix with calls to get_next_lexical_item.
+        """
+        buffer = self.numpy_token_buffer()
+        if buffer is not None:
+            yield from buffer.tokens()
+            return
+
+        while self.position < self.end or not self.get_next_line():
+            buffer = self.buffer
+            scanner = self.scanner
+            end = self.end
+            line_number = self.line_number
+            line_start = self.line_start
+            position = self.position
+
+            while position < end:
+                match = scanner.match(buffer, position, end)
+                group = match.lastindex
+                value = match.group(group)
+
+                if group == _identifier_group:
+                    code = _reserved_codes.get(value.lower(), _identifier_code)
+                elif group == _punctuation_group:
+                    code = _punctuation_codes[value]
+                else:
+                    code = _group_codes[group]
+
+                yield (code, value, line_number, position - line_start + 1)
+                position = self.position = match.end()
+
+            self.col_number = position - line_start + 1
+
+
+    def numpy_token_buffer(self):
+        """ Returns the token_buffer of the whole file, as lexed by the NumPy
+            backend, if the file has been read in bulk, is at least
+            numpy_threshold characters long and not yet lexed, and the backend
+            is available and applicable, else None.
+        """
+        if self.line_starts is None or self.line_number != 0 or \
+                numpy_threshold is None or len(self.buffer) < numpy_threshold:
+            return None
+
+        from . import numpy_lexer
+        result = numpy_lexer.lex_text(self.buffer, self.binary)
+        if result is not None:
+            self.line_number = result.eof_line_number
+            self.col_number = result.eof_col_number
+            self.position = self.end = len(self.buffer)
         return result
 
 
-    def is_resererved_word(self, word):
-        """ if is a resered form, returns the associated lext kind,
-            otherwise retuens None
+    def get_token_buffer(self):
+        """ Reads all the remaining lexical items into a token_buffer.
         """
-        word = word.lower()
-        return reserved_words.get(word, None)
-
-    def is_identifier_char(self, char):
-        # We allow colon, for stuff like Q:group
+        result = self.numpy_token_buffer()
+        if result is not None:
+            if self.stats is not None:
+                self.stats.count_tokens(result.kinds)
+                self.stats.lines_in += self.line_number - 1
+            return result
+
+        result = token_buffer()
+        kinds = result.kinds
+        starts = result.starts
+        ends = result.ends
+        lines = result.lines
+        cols = result.cols
+
+        # When reading line by line, the buffer text is the lines joined by
+        # new line characters, and base is the current line's offset.
         #
-        return char.isalpha() or char.isnumeric() or char == ':'
+        bulk = self.line_starts is not None
+        pieces = [self.buffer]
+        piece_line_number = self.line_number
+        base = 0
+        size = len(self.buffer) + 1
+
+        while self.position < self.end or not self.get_next_line():
+            buffer = self.buffer
+            if not bulk and self.line_number != piece_line_number:
+                pieces.append(buffer)
+                piece_line_number = self.line_number
+                base = size
+                size += len(buffer) + 1
+
+            scanner = self.scanner
+            end = self.end
+            line_number = self.line_number
+            line_start = self.line_start
+            position = self.position
+
+            while position < end:
+                match = scanner.match(buffer, position, end)
+                group = match.lastindex
+
+                if group == _identifier_group:
+                    code = _reserved_codes.get(match.group(group).lower(), _identifier_code)
+                elif group == _punctuation_group:
+                    code = _punctuation_codes[buffer[position]]
+                else:
+                    code = _group_codes[group]
+
+                kinds.append(code)
+                starts.append(base + position)
+                ends.append(base + match.end(group))
+                lines.append(line_number)
+                cols.append(position - line_start + 1)
+                position = match.end()
+
+            self.position = position
+            self.col_number = position - line_start + 1
+
+        result.text = self.buffer if bulk else "\n".join(pieces)
+        result.eof_line_number = self.line_number
+        result.eof_col_number = self.col_number
+
+        if self.stats is not None:
+            self.stats.count_tokens(kinds)
+            self.stats.lines_in += self.line_number - 1
+        return result
 
 
 reserved_words = {
@@ -334,5 +645,8 @@ reserved_words = {
     "special":     lex_kinds.Rw_Special
 }
 
+_reserved_codes = {word: kind.value for word, kind in reserved_words.items()}
+_identifier_code = lex_codes.Lk_Identifier
+
 
 # end
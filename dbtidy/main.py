@@ -2,48 +2,641 @@
     It parses areguments, and does backup file management.
 """
 
+import os
 import os.path
 import sys
-import shutil
-import traceback
+import time
 
 from . import __version__
-from . import common
-from . import dbtidy_lib
-from . import lexer
+
+# Only the modules needed to parse the command line are imported up front.
+# All others, including the rest of dbtidy, are imported where first needed,
+# so that e.g. --version, or tidying a single small file, starts quickly.
+#
+
+
+# The ways in which a file may be backed up before it is re-written.
+#
+backup_strategies = ("copy", "reflink", "atomic", "archive", "none")
+
+# The Linux ioctl that clones a file's extents, i.e. a reflink copy.
+#
+_FICLONE = 0x40049409
 
 
-def process_argument(filename):
+class options (object):
+    """ Holds the options that control how each file is processed.
+    """
+    def __init__(self):
+        self.bulk = False       # read each file in one go
+        self.binary = False     # read and write the files in byte mode
+        self.check = False      # check only, do not modify any files
+        self.diff = False       # write the unified diff, do not modify any files
+        self.stats = False      # collect per file timings and counters
+        self.lines = None       # (first, last) line range to tidy, or None
+        self.io_threads = 0     # threads for overlapped reads and writes
+        self.io_limit = 64 * 1024 * 1024    # bytes held by the I/O threads
+        self.names = False      # collect the declared record and alias names
+        self.dbd_files = []     # the .dbd files defining the record types
+        self.dbd_paths = []     # the directories searched for included .dbd files
+        self.use_cache = True   # use the on disk caches
+        self.changed_lines = None   # dict of path to changed line ranges, or None
+        self.backup = "copy"    # the backup strategy, one of backup_strategies
+        self.archive = None     # the backup_archive, when backup is archive
+        self.messages_to_stderr = False     # stdout is reserved, e.g. for the diff
+
+
+    def __getstate__(self):
+        # The archive is only written by the main process, so is not passed to
+        # worker processes, which instead return their writes as pending_write.
+        #
+        state = dict(self.__dict__)
+        state["archive"] = None
+        return state
+
+
+class error_entry (object):
+    """ The entry returned for a file that could not be processed, e.g. on an
+        exception, as distinct from None, that of a file found not tidy.
+    """
+    pass
+
+
+def message_file(opts):
+    """ Returns the file to which messages, other than warnings and errors,
+        are written: stdout, unless reserved, e.g. for the diff.
+    """
+    return sys.stderr if opts.messages_to_stderr else sys.stdout
+
+
+def process_argument(filename, opts=None, known=None, prefetched=None, pipeline=None):
+    """ Tidies filename, unless known, its tidy_cache entry, shows it is tidy.
+        The file is only backed up and re-written if tidying changes it.
+        In check mode, the file is never modified, and the formatting stops at
+        the first difference from the file's current content.
+        Returns the file's new cache entry, or an error_entry on failure, or
+        None if, when checking, the file is not tidy; the file's stats, a
+        file_stats, if requested, else None; and the names declared by the
+        file, a name_collector, if requested, else None.
+        If prefetched is specified, it is the future of the read_argument of
+        filename. If pipeline, an io_pipeline, is specified, any backup and
+        write is done in the background, and the entry returned is a future.
+    """
+    from . import common
+    from . import stats
+
+    opts = opts or options()
+    file_stats = stats.file_stats(filename) if opts.stats else None
+    names = None
+    if opts.names:
+        from . import name_index
+        names = name_index.name_collector()
+
+    entry = None
     try:
         backup = filename + ".~"
 
-        print(filename)
+        if not opts.diff:
+            print(filename, file=message_file(opts))
+
+        # Save as a global, to support any diagnostic/error messages.
+        #
+        common.source_file_name = filename
+        if opts.changed_lines is not None:
+            common.warning_lines = opts.changed_lines.get(os.path.abspath(filename), [])
+
+        entry = tidy_argument(filename, backup, opts, known, file_stats,
+                              prefetched, pipeline, names)
+
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        entry = error_entry()
+
+    if file_stats is not None:
+        print("    " + file_stats.summary(), file=message_file(opts))
+
+    return entry, file_stats, names
+
+
+def read_argument(filename, known):
+    """ Returns the (os.stat info, content, read time) of filename, but does
+        not read the content, returning None, if known, its tidy_cache entry,
+        shows it is tidy and unmodified.
+    """
+    start = time.perf_counter()
+
+    info = os.stat(filename)
+    if known is not None and known[:2] == (info.st_size, info.st_mtime_ns):
+        return info, None, 0.0
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    return info, data, time.perf_counter() - start
+
+
+def tidy_argument(filename, backup, opts, known, file_stats,
+                  prefetched=None, pipeline=None, names=None):
+    """ Does the work of process_argument. The names, if specified, are only
+        marked complete if the whole file is processed.
+    """
+    from . import cache
+    from . import dbtidy_lib
+
+    record_schema = None
+    if opts.dbd_files:
+        from . import schema
+        record_schema = schema.load(opts.dbd_files, opts.dbd_paths, opts.use_cache)
+
+    if prefetched is None:
+        info, data, read_time = read_argument(filename, known)
+    else:
+        info, data, read_time = prefetched.result()
+
+    # Recorded as tidy and not since modified - skip without reading.
+    #
+    if data is None:
+        return known
+
+    if file_stats is not None:
+        file_stats.read_time = read_time
+        file_stats.bytes_in = len(data)
+
+    digest = cache.content_digest(data)
+    if known is not None and known[2] == digest:
+        return (info.st_size, info.st_mtime_ns, digest)
+
+    if opts.lines is not None:
+        first, last = opts.lines
+        tidy_data = dbtidy_lib.process_range_data(filename, data, first, last, file_stats,
+                                                  opts.binary)
+        if opts.diff:
+            return diff_argument(filename, info, data, tidy_data, digest,
+                                 binary=opts.binary)
+
+        if opts.check:
+            if tidy_data == data:
+                return (info.st_size, info.st_mtime_ns, digest)
+
+            print("%s: lines %d to %d not tidy" % (filename, first, last),
+                  file=message_file(opts))
+            return None
+
+    elif opts.diff:
+        from . import tidy_diff
+        tidy_data, diff = tidy_diff.diff_data(filename, data, opts.bulk, file_stats,
+                                              names, record_schema, binary=opts.binary)
+        if names is not None:
+            names.complete = True
+        return diff_argument(filename, info, data, tidy_data, digest, diff, opts.binary)
+
+    elif opts.check:
+        tidy = dbtidy_lib.check_data(filename, data, opts.bulk, names, record_schema,
+                                     opts.binary, file_stats)
+        if names is not None:
+            names.complete = True
+
+        if tidy:
+            return (info.st_size, info.st_mtime_ns, digest)
 
+        print("%s: not tidy" % filename, file=message_file(opts))
+        return None
+
+    else:
+        tidy_data = dbtidy_lib.process_data(filename, data, opts.bulk, file_stats,
+                                            names, record_schema, opts.binary)
+        if names is not None:
+            names.complete = True
+
+    if file_stats is not None:
+        file_stats.bytes_out = len(tidy_data)
+
+    if tidy_data == data:
+        return (info.st_size, info.st_mtime_ns, digest)
+
+    # The names' line numbers must be those of the file as re-written.
+    #
+    if names is not None:
+        names.reset()
+        dbtidy_lib.collect_names(filename, tidy_data, names, opts.binary)
+        names.complete = True
+
+    if opts.backup == "archive" and opts.archive is None:
+        return pending_write(data, tidy_data)
+
+    if pipeline is not None:
+        return pipeline.write(write_argument, tidy_data,
+                              filename, backup, tidy_data, file_stats, opts, data)
+
+    return write_argument(filename, backup, tidy_data, file_stats, opts, data)
+
+
+def diff_argument(filename, info, data, tidy_data, digest, diff=None, binary=False):
+    """ Writes the unified diff of data, the content of filename, and tidy_data
+        to stdout, and returns the file's cache entry if tidy, else None. If
+        diff is not specified, data and tidy_data differ in one run of lines.
+        A change of line endings only is reported to stderr, as no diff.
+        In byte mode, the diff is written as the original bytes, unless stdout
+        is text only, when it is decoded as per its encoding.
+    """
+    if tidy_data == data:
+        return (info.st_size, info.st_mtime_ns, digest)
+
+    if diff is None:
+        from . import tidy_diff
+        diff = tidy_diff.diff_range_data(filename, data, tidy_data, binary=binary)
+
+    if not diff:
+        print("%s: line endings not tidy" % filename, file=sys.stderr)
+
+    elif binary:
+        from . import lexer
+        write_output(diff.encode(lexer.byte_encoding))
+
+    else:
+        sys.stdout.write(diff)
+    return None
+
+
+class pending_write (object):
+    """ The write of a tidied file left to the main process, as returned by
+        worker processes when the backups are all written to the one archive.
+    """
+    def __init__(self, data, tidy_data):
+        self.data = data
+        self.tidy_data = tidy_data
+
+
+def write_argument(filename, backup, tidy_data, file_stats, opts=None, data=None):
+    """ Backs up and writes filename, and returns its new cache entry.
+        The data, the file's original content, is required by the archive
+        backup strategy.
+    """
+    from . import cache
+
+    opts = opts or options()
+    start = time.perf_counter()
+
+    write_tidy_file(filename, backup, tidy_data, opts.backup, data, opts.archive)
+
+    if file_stats is not None:
+        file_stats.write_time = time.perf_counter() - start
+
+    info = os.stat(filename)
+    return (info.st_size, info.st_mtime_ns, cache.content_digest(tidy_data))
+
+
+def write_tidy_file(filename, backup, tidy_data, strategy="copy", data=None, archive=None):
+    """ Backs up filename, as per strategy, and replaces its content with
+        tidy_data (bytes). The original content, data, and a backup_archive
+        are required by the archive strategy.
+    """
+    import shutil
+
+    if strategy == "atomic" and write_atomic(filename, backup, tidy_data):
+        return
+
+    if strategy == "reflink":
+        reflink_file(filename, backup)
+
+    elif strategy == "archive":
+        archive.add(filename, data)
+
+    elif strategy != "none":
         # Create a backup file.
         # Note: we copy, as opposed to do moving original, file to create the back up
-        # and there by create a new file; and then process from the backup file back
-        # to the original file. In this way, filename remains the same file and gets
+        # and there by create a new file; and then write the tidy content back to
+        # the original file. In this way, filename remains the same file and gets
         # updated. This preserves attributes and, at least on Linux, the inode number,
         # and any file-system hard links to the file are preserved.
         #
         shutil.copy(filename, backup)
 
-        # Save as a global, to support any diagnostic/error messages.
-        #
-        common.source_file_name = filename
+    with open(filename, 'wb') as f:
+        f.write(tidy_data)
 
-        dbtidy_lib.process_file(backup, filename)
 
-    except Exception:
-        traceback.print_exc()
+def write_atomic(filename, backup, tidy_data):
+    """ Backs up filename as a hard link to the original, and replaces it with
+        a new file, with the same permissions, containing tidy_data. So readers
+        see either the old or new content, never a partial file, and the
+        content is written once and never copied. Returns False, having done
+        nothing, if filename has other hard links, which must be preserved by
+        updating the file in place, or the file system does not support links.
+    """
+    import tempfile
+
+    info = os.stat(filename)
+    if info.st_nlink > 1:
+        return False
+
+    try:
+        if os.path.lexists(backup):
+            os.remove(backup)
+        os.link(filename, backup)
+    except OSError:
+        return False
+
+    directory, name = os.path.split(filename)
+    handle, temp = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp",
+                                    dir=directory or ".")
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(tidy_data)
+        os.chmod(temp, info.st_mode & 0o7777)
+        try:
+            os.chown(temp, info.st_uid, info.st_gid)
+        except OSError:
+            pass    # not permitted - the file is now owned by the user
+        os.replace(temp, filename)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return True
+
+
+def reflink_file(filename, backup):
+    """ Copies filename to backup, sharing the data blocks where the file system
+        supports it (e.g. Btrfs, XFS), so nothing is read or written; otherwise
+        as per shutil.copy.
+    """
+    import shutil
+
+    try:
+        import fcntl
+        with open(filename, 'rb') as source, open(backup, 'wb') as target:
+            fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+    except (ImportError, OSError):
+        shutil.copy(filename, backup)
+        return
+    shutil.copymode(filename, backup)
+
+
+class backup_archive (object):
+    """ A compressed tar file holding the original content of each file
+        re-written in this run, by absolute path, so that the files may be
+        restored with e.g.: tar -xzf archive -C /
+        The archive is only created if any file is added to it. Files may be
+        added from multiple threads.
+    """
+    def __init__(self, filename):
+        import threading
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.tar = None
+        self.count = 0
 
 
-def print_version():
+    def add(self, filename, data):
+        import io
+        import tarfile
+
+        info = os.stat(filename)
+        member = tarfile.TarInfo(os.path.abspath(filename).lstrip(os.sep))
+        member.size = len(data)
+        member.mtime = info.st_mtime
+        member.mode = info.st_mode & 0o7777
+        member.uid = info.st_uid
+        member.gid = info.st_gid
+
+        with self.lock:
+            if self.tar is None:
+                self.tar = tarfile.open(self.filename, "w:gz")
+            self.tar.addfile(member, io.BytesIO(data))
+            self.count += 1
+
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+def process_argument_captured(filename, opts=None, known=None):
+    """ As per process_argument, but also returns the standard output, as
+        bytes encoded as per stdout, and the standard error text instead of
+        writing them, for use by worker processes. Byte mode diffs are
+        captured as the original bytes.
+    """
+    import contextlib
+    import io
+
+    out = io.TextIOWrapper(io.BytesIO(), output_encoding(),
+                           getattr(sys.stdout, "errors", None), newline='')
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        entry, file_stats, names = process_argument(filename, opts, known)
+    out.flush()
+    return out.buffer.getvalue(), err.getvalue(), entry, file_stats, names
+
+
+def output_encoding():
+    """ Returns the encoding of stdout.
+    """
+    import locale
+    return getattr(sys.stdout, "encoding", None) or locale.getpreferredencoding(False)
+
+
+def write_output(data):
+    """ Writes data, bytes encoded as per stdout, to stdout.
+    """
+    if hasattr(sys.stdout, "buffer"):
+        sys.stdout.flush()
+        sys.stdout.buffer.write(data)
+    else:
+        sys.stdout.write(data.decode(output_encoding(), "replace"))
+
+
+def process_arguments(filenames, opts, jobs=1, tidy_cache=None, stats_handler=None,
+                      index=None):
+    """ Processes each file, using a pool of jobs worker processes if jobs is
+        more than one. The output of each file is written as a block, and in
+        the order of filenames. Submission to the pool is bounded, so filenames
+        may be an arbitarily long iterable. Each file's stats, if collected,
+        are passed to stats_handler. If index, a name_index, is specified, it
+        is updated with the names declared by each file, and any file it has
+        not indexed since last modified is always read, even if known to be
+        tidy. Returns the number of files processed, the number found not
+        tidy when checking, and the number that could not be processed.
+    """
+    count = 0
+    failures = 0
+    errors = 0
+
+    def record(filename, entry, file_stats, names=None):
+        nonlocal count
+        nonlocal failures
+        nonlocal errors
+        count += 1
+        if isinstance(entry, error_entry):
+            errors += 1
+            entry = None
+        elif entry is None:
+            failures += 1
+        if tidy_cache is not None:
+            tidy_cache.update(filename, entry)
+        if file_stats is not None and stats_handler is not None:
+            stats_handler(file_stats)
+        if index is not None and names is not None:
+            if names.complete:
+                index.update(filename, names)
+            elif entry is None:
+                index.forget(filename)
+
+    def lookup(filename):
+        if tidy_cache is None:
+            return None
+        if index is not None and not index.is_current(filename):
+            return None
+        return tidy_cache.lookup(filename)
+
+    if jobs <= 1 and opts.io_threads > 0:
+        process_overlapped(filenames, opts, lookup, record)
+        return count, failures, errors
+
+    if jobs <= 1:
+        for filename in filenames:
+            record(filename, *process_argument(filename, opts, lookup(filename)))
+        return count, failures, errors
+
+    import collections
+    import concurrent.futures
+
+    pending = collections.deque()
+
+    def write_result(filename, future):
+        try:
+            out, err, entry, file_stats, names = future.result()
+        except Exception:
+            # The worker process died, or its arguments or result could not
+            # be pickled.
+            #
+            import traceback
+            print("%s: failed" % filename, file=message_file(opts))
+            traceback.print_exc()
+            record(filename, error_entry(), None)
+            return
+
+        write_output(out)
+        sys.stdout.flush()
+        sys.stderr.write(err)
+        sys.stderr.flush()
+        if isinstance(entry, pending_write):
+            try:
+                entry = write_argument(filename, filename + ".~", entry.tidy_data,
+                                       file_stats, opts, entry.data)
+            except Exception:
+                import traceback
+                print("%s: write failed" % filename, file=message_file(opts))
+                traceback.print_exc()
+                entry = error_entry()
+        record(filename, entry, file_stats, names)
+
+    def submit(executor, filename):
+        try:
+            return executor.submit(process_argument_captured, filename, opts,
+                                   lookup(filename))
+        except concurrent.futures.BrokenExecutor as error:
+            # Reported, as is each file pending, by write_result.
+            #
+            future = concurrent.futures.Future()
+            future.set_exception(error)
+            return future
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for filename in filenames:
+            pending.append((filename, submit(executor, filename)))
+            if len(pending) >= 2 * jobs:
+                write_result(*pending.popleft())
+
+        while pending:
+            write_result(*pending.popleft())
+
+    return count, failures, errors
+
+
+def process_overlapped(filenames, opts, lookup, record):
+    """ As per the sequential processing of filenames by process_arguments,
+        but with the upcoming files read, and the tidied files backed up and
+        written, by a pool of opts.io_threads threads. Calls record with each
+        file's name, entry, stats and names, once complete.
+    """
+    import collections
+    from . import io_pipeline
+
+    writing = collections.deque()
+    written = set()
+
+    def write_done(filename, future, file_stats, names):
+        try:
+            entry = future.result()
+        except Exception:
+            import traceback
+            print("%s: write failed" % filename, file=message_file(opts))
+            traceback.print_exc()
+            entry = error_entry()
+        record(filename, entry, file_stats, names)
+
+    with io_pipeline.io_pipeline(opts.io_threads, opts.io_limit) as pipeline:
+        for filename, known, prefetched in pipeline.prefetch(filenames, lookup,
+                                                             read_argument):
+            # A file named again after being written (or while still being
+            # written) may have been read ahead too soon, so must be re-read.
+            #
+            path = os.path.abspath(filename)
+            if path in written:
+                while writing:
+                    write_done(*writing.popleft())
+                prefetched = None
+
+            entry, file_stats, names = process_argument(filename, opts, known,
+                                                        prefetched, pipeline)
+            if isinstance(entry, io_pipeline.future_type):
+                writing.append((filename, entry, file_stats, names))
+                written.add(path)
+            else:
+                record(filename, entry, file_stats, names)
+
+            while writing and writing[0][1].done():
+                write_done(*writing.popleft())
+
+        while writing:
+            write_done(*writing.popleft())
+
+
+def process_stdin(opts, stats_json=None):
+    """ Tidies the standard input to the standard output, as a filter. All
+        messages are written to standard error. If stats_json, a filename, is
+        specified, the statistics are written to it as a JSON object.
+    """
+    from . import dbtidy_lib
+    from . import stats
+
+    file_stats = stats.file_stats("<stdin>") if opts.stats else None
+    if opts.binary:
+        import io
+        from . import lexer
+        reader = io.TextIOWrapper(sys.stdin.buffer, lexer.byte_encoding, newline='\n')
+        writer = io.TextIOWrapper(sys.stdout.buffer, lexer.byte_encoding, newline='\n')
+        dbtidy_lib.tidy_filter(reader, writer, "<stdin>", file_stats, True)
+        writer.detach()
+    else:
+        dbtidy_lib.tidy_filter(sys.stdin, sys.stdout, "<stdin>", file_stats)
+    if file_stats is not None:
+        print("    " + file_stats.summary(), file=sys.stderr)
+        if stats_json is not None:
+            import json
+            with open(stats_json, 'w') as json_file:
+                json_file.write(json.dumps(file_stats.as_dict()) + "\n")
+
+
+def print_version(out=None):
     """ Print version
     """
     vi = sys.version_info
     print("dbtidy version: %s  (python %s.%s.%s)" %
-          (__version__, vi.major, vi.minor, vi.micro))
+          (__version__, vi.major, vi.minor, vi.micro), file=out)
 
 
 # The command line structure is too simple to warrent using Click.
@@ -51,18 +644,147 @@ def print_version():
 def main():
     name = os.path.basename(sys.argv.pop(0))    # drop the program name
 
-    if len(sys.argv) >= 1:
-        if sys.argv[0] in ("-h", "--help"):
+    opts = options()
+    jobs = 1
+    cache_filename = None
+    use_cache = True
+    stats_json = None
+    serve = False
+    use_stdin = False
+    address = None
+    index_filename = None
+    index_report = False
+    includes = []
+    excludes = []
+    archive_filename = None
+    since = None
+    staged = False
+    changed_lines = False
+    paths = []
+
+    args = iter(sys.argv)
+    for arg in args:
+        if arg in ("-h", "--help"):
+            from . import cache
+            from . import discover
             print("""\
 {name} version {version}
 
-usage: {name} filenames...
+usage: {name} [options] filenames and/or directories...
+       {name} [options] -
        {name} -h, --help
        {name} -V, --version
 
 {name} perform a standard layout formatting on one or more EPICS database,
 template and/or dbd files. Prior to formating, a backup copy of each file
-is created with the name '<filename>.~'.
+is created with the name '<filename>.~', see --backup. Files that are
+already tidy are not modified, and no backup is created.
+
+If the filename is - (or --stdin), {name} reads the standard input and
+writes the tidy text to the standard output, with constant memory use, so
+may be used as a filter in a pipeline. The output is flushed at the end of
+each record.
+
+Directories are searched recursively for files matching {includes}
+(skipping backup files, and {skips} directories).
+
+The exit status is 2 if any file could not be processed, e.g. could not be
+read, decoded or written, else 1 if any file was found not tidy (see --check),
+or on any other error, else 0.
+
+options:
+  -b, --bulk      read each file in one go, memory mapping large files, as
+                  opposed to line by line. Faster on network file systems.
+  --bytes         read and write the files as bytes, rather than text in the
+                  locale's encoding. Any bytes other than ASCII are taken to
+                  be letters, and are passed through unchanged, so that files
+                  in any ASCII compatible encoding, e.g. Latin-1 or UTF-8,
+                  may be tidied, whatever the locale. Only \\n ends a line,
+                  but a \\r at the end of a line is removed, as is any other
+                  trailing white space, so CRLF line endings become LF.
+  --check         check only: report files that are not tidy, and exit with
+                  status 1 if there are any, or status 2 if any file could not
+                  be checked, e.g. could not be read or decoded. No files are
+                  modified.
+  --diff          write the unified diff of the changes tidying would make to
+                  each file, and exit with status 1 if there are any, or status
+                  2 if any file could not be processed, as per --check. No files
+                  are modified. Changes of line endings only are reported,
+                  but not shown. The diff is found in linear time, as tidying
+                  only changes the white space between tokens.
+  --lines=FIRST[:LAST]
+                  only tidy the records enclosing lines FIRST to LAST, or just
+                  line FIRST, leaving the rest of each file as is. Formatting
+                  restarts at the enclosing record, grecord or recordtype. The
+                  cache is not used.
+  --stats         report the read, lex, format and write times, and token,
+                  line, record, byte and warning counts for each file, and
+                  the totals.
+  --stats-json=FILE
+                  as --stats, and also write the statistics for each file as
+                  a JSON object per line to FILE, or if FILE is -, to stdout,
+                  in which case all other messages are written to stderr.
+                  Only a FILE may be used when tidying the standard input.
+  --since REF, --since=REF
+                  only process the files added, copied, modified or renamed
+                  since the git commit REF, as reported by the local git
+                  repository. Any filenames and/or directories restrict the
+                  files considered. Files are selected as when searching
+                  directories, see --include and --exclude.
+  --staged        as --since, but only process the changes staged for commit.
+  --changed-lines with --since or --staged, only report warnings for the
+                  lines added or changed.
+  --backup=STRATEGY
+                  how each file is backed up before being re-written, one of:
+                    copy     copy to '<filename>.~', then update the file in
+                             place (the default);
+                    reflink  as copy, but sharing the data blocks where the
+                             file system supports it, e.g. Btrfs or XFS;
+                    atomic   hard link the file as '<filename>.~', then
+                             replace it with a new file, with the same
+                             permissions. Files with other hard links are
+                             backed up and updated as per copy;
+                    archive  add the original content to one compressed tar
+                             file for the run, see --backup-archive;
+                    none     no backup.
+  --backup-archive=FILE
+                  the archive used by --backup=archive. The default is
+                  dbtidy-backup-<date>-<time>.tar.gz in the current directory.
+  --include=GLOB  select files matching GLOB, rather than the defaults, when
+                  searching directories. May be repeated.
+  --exclude=GLOB  skip files and directories matching GLOB when searching
+                  directories. May be repeated.
+  -j, --jobs N    process files using N worker processes. When N is 0, uses
+                  one worker per CPU. The default is 1, i.e. no workers.
+  --io-threads=N  when not using worker processes, read upcoming files, and
+                  back up and write tidied files, using N threads, while
+                  formatting. This hides storage latency, e.g. on network
+                  file systems. The default is 0, i.e. no threads.
+  --io-limit=SIZE the bytes that may be held, read ahead or waiting to be
+                  written, by the I/O threads, e.g. 500K, 64M (the default).
+  --index=FILE    record the names declared by each file's record, grecord and
+                  alias definitions in the index FILE, which is updated as
+                  each file is processed. Not updated when using --lines.
+  --index-report  report the duplicate record names and dangling aliases in
+                  the index, after processing any files, and exit with status
+                  1 if there are any. Requires --index.
+  --dbd=FILE      check the record types and field names of each record against
+                  the recordtype definitions in the .dbd FILE, and its include
+                  files. May be repeated. The definitions are cached, and only
+                  re-read when any of the files are modified. The cache of
+                  tidy files is not used, so that every file is checked.
+  --dbd-path=DIR  look for .dbd include files in DIR, after the including
+                  file's directory. May be repeated.
+  --cache=FILE    the file used to record files known to be tidy, which are
+                  then skipped if unchanged. The default is:
+                  {cache}
+                  or, with --bytes, tidy_cache_bytes.json alongside.
+  --no-cache      do not use (or update) the cache, nor the .dbd cache.
+  --serve[=SOCKET]
+                  run as a server, handling JSON-RPC requests to tidy text or
+                  files, one per line, on the standard input and output or,
+                  if specified, on the Unix domain socket SOCKET. The server
+                  keeps the results of recent requests. See dbtidy-client.
 
 Note: {name} does not handle extended fields and extended info structures
 very well (yet).
@@ -71,21 +793,288 @@ Copyright (c) 2007-2022  Andrew C. Starritt
 
 Transcoded from original Ada dbtidy program to Python in 2020, which
 itself was based loosely on my Delphi Pascal tidy program.
-""".format(version=__version__, name=name))
+""".format(version=__version__, name=name, cache=cache.default_filename(),
+           includes=", ".join(discover.default_includes),
+           skips=", ".join(discover.skip_directories)))
             return
 
-        if sys.argv[0] in ("-V", "--version"):
+        if arg in ("-V", "--version"):
             print_version()
             return
 
-    print_version()
+        if arg in ("-b", "--bulk"):
+            opts.bulk = True
+
+        elif arg == "--bytes":
+            opts.binary = True
+
+        elif arg in ("-", "--stdin"):
+            use_stdin = True
+
+        elif arg == "--check":
+            opts.check = True
+
+        elif arg == "--diff":
+            opts.diff = True
+
+        elif arg.startswith("--lines="):
+            first, _, last = arg[8:].partition(":")
+            last = last or first
+            if not (first.isdigit() and last.isdigit()):
+                print("%s: invalid line range: '%s'" % (name, arg[8:]))
+                return 1
+
+            opts.lines = (int(first), int(last))
+
+        elif arg == "--stats":
+            opts.stats = True
+
+        elif arg.startswith("--stats-json="):
+            opts.stats = True
+            stats_json = arg[13:]
+
+        elif arg in ("-j", "--jobs") or arg.startswith("--jobs=") or \
+                (arg.startswith("-j") and arg[2:].isdigit()):
+            if arg in ("-j", "--jobs"):
+                value = next(args, "")
+            else:
+                value = arg[7:] if arg.startswith("--jobs=") else arg[2:]
+
+            if not value.isdigit():
+                print("%s: invalid number of jobs: '%s'" % (name, value))
+                return 1
+
+            jobs = int(value) or os.cpu_count() or 1
+
+        elif arg.startswith("--io-threads="):
+            value = arg[13:]
+            if not value.isdigit():
+                print("%s: invalid number of I/O threads: '%s'" % (name, value))
+                return 1
+
+            opts.io_threads = int(value)
+
+        elif arg.startswith("--io-limit="):
+            from . import io_pipeline
+            value = io_pipeline.parse_size(arg[11:])
+            if value is None:
+                print("%s: invalid I/O limit: '%s'" % (name, arg[11:]))
+                return 1
+
+            opts.io_limit = value
+
+        elif arg.startswith("--index="):
+            index_filename = arg[8:]
+
+        elif arg == "--index-report":
+            index_report = True
+
+        elif arg.startswith("--dbd="):
+            opts.dbd_files.append(arg[6:])
+
+        elif arg.startswith("--dbd-path="):
+            opts.dbd_paths.append(arg[11:])
+
+        elif arg.startswith("--cache="):
+            cache_filename = arg[8:]
+
+        elif arg == "--no-cache":
+            use_cache = False
+            opts.use_cache = False
+
+        elif arg == "--serve" or arg.startswith("--serve="):
+            serve = True
+            address = arg[8:] or None
+
+        elif arg.startswith("--backup="):
+            opts.backup = arg[9:]
+            if opts.backup not in backup_strategies:
+                print("%s: invalid backup strategy: '%s', expecting one of: %s" %
+                      (name, opts.backup, ", ".join(backup_strategies)))
+                return 1
+
+        elif arg.startswith("--backup-archive="):
+            archive_filename = arg[17:]
+
+        elif arg == "--since" or arg.startswith("--since="):
+            since = next(args, "") if arg == "--since" else arg[8:]
+            if not since:
+                print("%s: --since requires a git commit" % name)
+                return 1
+
+        elif arg == "--staged":
+            staged = True
+
+        elif arg == "--changed-lines":
+            changed_lines = True
+
+        elif arg.startswith("--include="):
+            includes.append(arg[10:])
+
+        elif arg.startswith("--exclude="):
+            excludes.append(arg[10:])
+
+        else:
+            paths.append(arg)
+
+    from . import cache
+    from . import discover
+    from . import stats
+
+    if use_stdin:
+        if paths or opts.check or opts.diff or opts.lines is not None or serve:
+            print("%s: - (--stdin) may not be used with files, --check, --diff, "
+                  "--lines or --serve" % name, file=sys.stderr)
+            return 1
+        if stats_json == "-":
+            print("%s: - (--stdin) may not be used with --stats-json=-" % name,
+                  file=sys.stderr)
+            return 1
+        try:
+            process_stdin(opts, stats_json)
+        except BrokenPipeError:
+            # The reader has gone away, e.g. piped to head. Python would also
+            # fail flushing stdout at exit, so redirect it to the null device.
+            #
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        return
+
+    if serve:
+        from . import server
+        try:
+            server.serve(address)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # The diff, or the JSON statistics, are the only standard output, so that
+    # it may be piped to patch, or parsed. All other messages are written to
+    # standard error.
+    #
+    if opts.diff and stats_json == "-":
+        print("%s: --diff may not be used with --stats-json=-" % name, file=sys.stderr)
+        return 1
+
+    opts.messages_to_stderr = opts.diff or stats_json == "-"
+    out = message_file(opts)
+    if not opts.diff:
+        print_version(out)
+
+    if since is not None or staged:
+        from . import git_changes
+        try:
+            selected = [path for path in git_changes.changed_files(since, staged, paths)
+                        if discover.is_selected(path, includes, excludes)]
+            if changed_lines:
+                opts.changed_lines = git_changes.changed_lines(since, staged, paths)
+        except git_changes.git_error as error:
+            print("%s: git: %s" % (name, error), file=out)
+            return 1
+
+        if not selected:
+            print("no changed files", file=out)
+            return
+
+        paths = [os.path.relpath(path) for path in selected]
+
+    elif changed_lines:
+        print("%s: --changed-lines requires --since or --staged" % name, file=out)
+        return 1
+
+    # The cache records whole files as tidy, so is not applicable to ranges.
+    # Nor is it used when checking against a schema, as a file known to be
+    # tidy would be skipped, and so not checked.
+    #
+    if opts.lines is not None or opts.dbd_files:
+        use_cache = False
 
-    for filename in sys.argv:
-        process_argument(filename)
+    # Load the schema once, up front, so that any error is reported just once
+    # and no file is processed. The worker processes load it from the cache.
+    #
+    if opts.dbd_files:
+        from . import schema
+        try:
+            schema.load(opts.dbd_files, opts.dbd_paths, opts.use_cache)
+        except (OSError, UnicodeDecodeError) as error:
+            print("%s: cannot read dbd file: %s" % (name, error), file=out)
+            return 1
 
-    if len(sys.argv) == 0:
-        print("no files specified")
+    tidy_cache = None
+    if use_cache:
+        tidy_cache = cache.tidy_cache(cache_filename, "bytes" if opts.binary else "text")
+
+    if index_report and index_filename is None:
+        print("%s: --index-report requires --index=FILE" % name, file=out)
+        return 1
+
+    index = None
+    if index_filename is not None:
+        from . import name_index
+        index = name_index.name_index(index_filename)
+        opts.names = opts.lines is None
+
+    if opts.backup == "archive":
+        if archive_filename is None:
+            archive_filename = time.strftime("dbtidy-backup-%Y%m%d-%H%M%S.tar.gz")
+        opts.archive = backup_archive(archive_filename)
+
+    totals = stats.file_stats("total")
+    json_file = None
+    if stats_json is not None:
+        import json
+        json_file = sys.stdout if stats_json == "-" else open(stats_json, 'w')
+
+    def stats_handler(file_stats):
+        totals.add(file_stats)
+        if json_file is not None:
+            json_file.write(json.dumps(file_stats.as_dict()) + "\n")
+
+    try:
+        filenames = discover.find_files(paths, includes, excludes)
+        count, failures, errors = process_arguments(filenames, opts, jobs, tidy_cache,
+                                            stats_handler, index if opts.names else None)
+        problems = index.report(out) if index_report else 0
+    finally:
+        if json_file is not None and json_file is not sys.stdout:
+            json_file.close()
+        if index is not None:
+            index.close()
+        if opts.archive is not None:
+            opts.archive.close()
+            if opts.archive.count > 0:
+                print("%d original files saved in %s" % (opts.archive.count, archive_filename),
+                      file=out)
+
+    if opts.stats:
+        print("totals: %d files" % count, file=out)
+        print("    " + totals.summary(), file=out)
+
+    if tidy_cache is not None:
+        try:
+            tidy_cache.save()
+        except OSError as error:
+            print("%s: cannot save cache: %s" % (name, error), file=out)
+
+    if index_report:
+        print("%d duplicate record names and dangling aliases" % problems, file=out)
+
+    if len(paths) == 0:
+        if not index_report:
+            print("no files specified", file=out)
+    elif opts.check or opts.diff:
+        print("%d of %d files not tidy" % (failures, count), file=out)
     else:
-        print("complete")
+        print("complete", file=out)
+
+    # Files that could not be processed are errors, not formatting differences,
+    # so have their own exit status.
+    #
+    if errors > 0:
+        print("%d of %d files failed" % (errors, count), file=out)
+        return 2
+
+    if failures > 0 or problems > 0:
+        return 1
 
 # end
@@ -0,0 +1,244 @@
+""" This module provides the record name and alias index: the names declared
+    by record, grecord and alias definitions, collected from the tokens as each
+    file is tidied, and kept in an SQLite database so that duplicate record
+    names and dangling aliases may be found across many files without
+    re-reading any of them.
+"""
+
+import os
+import os.path
+import sqlite3
+
+from . import lexer
+from . import schema
+
+lex_codes = lexer.lex_codes
+
+# Increment if the schema changes - any older index is rebuilt from scratch.
+#
+schema_version = 1
+
+_schema = """
+create table files (id integer primary key,
+                    path text unique not null,
+                    size integer not null,
+                    mtime_ns integer not null);
+create table records (name text not null,
+                      file integer not null,
+                      line integer not null,
+                      type text not null);
+create table aliases (alias text not null,
+                      target text,
+                      file integer not null,
+                      line integer not null);
+create index records_name on records (name);
+create index records_file on records (file);
+create index aliases_file on aliases (file);
+"""
+
+
+# -----------------------------------------------------------------------------
+#
+class name_collector (schema.declaration_reader):
+    """ Collects the record and alias declarations from the tokens of a source
+        as they are passed on, unchanged, via tokens, e.g. to layout. So the
+        names are collected in the same pass as the formatting.
+        The records are (name, line, type) and aliases (alias, target, line)
+        tuples. The target of an alias within a record is that record.
+    """
+
+    keywords = (lex_codes.Rw_Record, lex_codes.Rw_Grecord, lex_codes.Rw_Alias)
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        """ Discards all names collected so far, and any source.
+        """
+        schema.declaration_reader.__init__(self, self.keywords, self.declared)
+        self.records = []
+        self.aliases = []
+        self.items = iter(())
+        self.record = None      # the name of the enclosing record, if any
+        self.complete = False   # set once all the source's tokens are seen
+
+
+    def __getstate__(self):
+        # The token iterator is not needed (nor can it be pickled) once done,
+        # e.g. when returned from a worker process.
+        #
+        state = dict(self.__dict__)
+        state["items"] = iter(())
+        return state
+
+
+    def attach(self, source):
+        """ Attaches the source, a lex_file or token_buffer; returns self.
+        """
+        self.items = source.tokens()
+        return self
+
+
+    def tokens(self):
+        """ As per lex_file.tokens.
+        """
+        push = self.push
+        for item in self.items:
+            push(item)
+            yield item
+
+
+    def push(self, item):
+        schema.declaration_reader.push(self, item)
+        if item[0] == lex_codes.Lk_Close_Brace and self.depth == 0:
+            self.record = None
+
+
+    def declared(self, depth, code, args, line, col):
+        if code == lex_codes.Rw_Alias:
+            if len(args) == 1 and depth > 0 and self.record is not None:
+                self.aliases.append((args[0], self.record, line))
+            elif len(args) == 2 and depth == 0:
+                self.aliases.append((args[1], args[0], line))
+
+        elif len(args) == 2 and depth == 0:
+            self.record = args[1]
+            self.records.append((args[1], line, args[0]))
+
+
+# -----------------------------------------------------------------------------
+#
+class name_index (object):
+    """ The on disk index of the names declared by each file, keyed by the
+        file's absolute path. Each file's entry is replaced as a whole when it
+        is updated, and records the file's size and modification time, so that
+        unmodified files need not be read again.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(filename)
+        version = self.db.execute("pragma user_version").fetchone()[0]
+        if version != schema_version:
+            for table in ("files", "records", "aliases"):
+                self.db.execute("drop table if exists %s" % table)
+            self.db.executescript(_schema)
+            self.db.execute("pragma user_version = %d" % schema_version)
+            self.db.commit()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.close()
+
+
+    def close(self):
+        """ Commits any updates, and closes the index.
+        """
+        self.db.commit()
+        self.db.close()
+
+
+    def is_current(self, filename):
+        """ Returns True if filename is indexed, and unmodified since.
+        """
+        row = self.db.execute("select size, mtime_ns from files where path = ?",
+                              (os.path.abspath(filename),)).fetchone()
+        if row is None:
+            return False
+        try:
+            info = os.stat(filename)
+        except OSError:
+            return False
+        return row == (info.st_size, info.st_mtime_ns)
+
+
+    def forget(self, filename):
+        """ Removes filename from the index.
+        """
+        path = os.path.abspath(filename)
+        row = self.db.execute("select id from files where path = ?", (path,)).fetchone()
+        if row is not None:
+            self.db.execute("delete from records where file = ?", row)
+            self.db.execute("delete from aliases where file = ?", row)
+            self.db.execute("delete from files where id = ?", row)
+
+
+    def update(self, filename, names):
+        """ Replaces the entry for filename with the names, a name_collector,
+            as collected from the file's current content.
+        """
+        self.forget(filename)
+        info = os.stat(filename)
+        cursor = self.db.execute("insert into files (path, size, mtime_ns) values (?, ?, ?)",
+                                 (os.path.abspath(filename), info.st_size, info.st_mtime_ns))
+        file_id = cursor.lastrowid
+        self.db.executemany("insert into records values (?, ?, ?, ?)",
+                            [(name, file_id, line, kind) for name, line, kind in names.records])
+        self.db.executemany("insert into aliases values (?, ?, ?, ?)",
+                            [(alias, target, file_id, line)
+                             for alias, target, line in names.aliases])
+
+
+    def prune(self):
+        """ Removes any files that no longer exist.
+        """
+        for (path,) in self.db.execute("select path from files").fetchall():
+            if not os.path.exists(path):
+                self.forget(path)
+
+
+    def duplicates(self):
+        """ Returns the list of (name, [(path, line, type), ...]) of the record
+            names declared more than once, sorted by name.
+        """
+        rows = self.db.execute("""
+            select r.name, f.path, r.line, r.type from records r
+            join files f on f.id = r.file
+            where r.name in (select name from records group by name having count(*) > 1)
+            order by r.name, f.path, r.line""").fetchall()
+
+        result = []
+        for name, path, line, kind in rows:
+            if not result or result[-1][0] != name:
+                result.append((name, []))
+            result[-1][1].append((path, line, kind))
+        return result
+
+
+    def dangling_aliases(self):
+        """ Returns the list of (alias, target, path, line) of the aliases whose
+            target is not an indexed record name, sorted by path and line.
+        """
+        return self.db.execute("""
+            select a.alias, a.target, f.path, a.line from aliases a
+            join files f on f.id = a.file
+            where a.target not in (select name from records)
+            order by f.path, a.line""").fetchall()
+
+
+    def report(self, out):
+        """ Writes the duplicate record names and dangling aliases to out.
+            Returns the total number of both.
+        """
+        self.prune()
+        duplicates = self.duplicates()
+        for name, places in duplicates:
+            out.write("duplicate record name: %s\n" % name)
+            for path, line, kind in places:
+                out.write("    %s:%d: %s\n" % (path, line, kind))
+
+        dangling = self.dangling_aliases()
+        for alias, target, path, line in dangling:
+            out.write("%s:%d: alias %s of unknown record: %s\n" % (path, line, alias, target))
+
+        return len(duplicates) + len(dangling)
+
+# end
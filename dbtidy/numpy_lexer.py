@@ -0,0 +1,340 @@
+""" This module provides an optional lexer backend, using NumPy, for large files
+    read in bulk. Rather than matching the scanner one item at a time, it
+    classifies every character of the buffer at once, and finds the items'
+    boundaries, and their line and col numbers, with array operations. Only
+    strings, comments and macros, which may contain any character, are found
+    one at a time, using the scanner's own patterns. The result is the same
+    token_buffer that lex_file.get_token_buffer produces.
+    If NumPy is not installed, available is False, and lex_text returns None.
+"""
+
+import re
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import lexer
+
+available = numpy is not None
+
+lex_codes = lexer.lex_codes
+
+# The buffer is processed in chunks of about this many characters, each a
+# whole number of lines, which bounds the memory used by the work arrays.
+#
+chunk_size = 1024 * 1024
+
+# Character classes.
+#
+C_Space = 0         # space and tab - the only white space between items
+C_Alpha = 1
+C_Digit = 2
+C_Colon = 3
+C_Punctuation = 4
+C_Quote = 5
+C_Hash = 6
+C_Dollar = 7
+C_New_Line = 8
+C_Other = 9
+
+# As per the scanner's string alternative.
+#
+_string = re.compile(r""" " (?: [^"\\] | \\"*[^"] )* (?: " | \\"*\Z )? """,
+                     re.VERBOSE | re.DOTALL)
+
+_tables = {}
+
+
+def _get_tables(binary):
+    """ Returns the (class, is space, punctuation code) tables, each indexed by
+        character code, for text (ASCII only) or byte mode.
+    """
+    tables = _tables.get(binary)
+    if tables is None:
+        classes = numpy.full(257, C_Other, dtype=numpy.uint8)
+        for char in range(256):
+            c = chr(char)
+            if c in " \t":
+                classes[char] = C_Space
+            elif ('a' <= c <= 'z') or ('A' <= c <= 'Z') or (binary and char >= 0x80):
+                classes[char] = C_Alpha
+            elif '0' <= c <= '9':
+                classes[char] = C_Digit
+            elif c == ':':
+                classes[char] = C_Colon
+            elif c in "(){}[],+-":
+                classes[char] = C_Punctuation
+            elif c == '"':
+                classes[char] = C_Quote
+            elif c == '#':
+                classes[char] = C_Hash
+            elif c == '$':
+                classes[char] = C_Dollar
+            elif c == '\n':
+                classes[char] = C_New_Line
+
+        # Line ends are stripped of any white space, as per str.rstrip or, in
+        # byte mode, of just lexer.byte_space, as per lex_file.
+        #
+        if binary:
+            is_space = numpy.array([chr(char) in lexer.byte_space for char in range(256)] +
+                                   [False])
+        else:
+            is_space = numpy.array([chr(char).isspace() for char in range(256)] + [False])
+
+        punctuation = numpy.full(257, lex_codes.Lk_Other, dtype=numpy.uint8)
+        for char, code in lexer._punctuation_codes.items():
+            punctuation[ord(char)] = code
+
+        tables = (classes, is_space, punctuation)
+        _tables[binary] = tables
+    return tables
+
+
+def _next_false(mask):
+    """ Returns, for each index i, the first index j >= i at which mask is
+        False. The last element of mask must be False.
+    """
+    size = len(mask)
+    index = numpy.where(mask, size, numpy.arange(size))
+    return numpy.minimum.accumulate(index[::-1])[::-1]
+
+
+def _word_keys(padded, starts, ends):
+    """ Returns a key of the length and first three characters, as if lower
+        case, of each word, such that equal words, ignoring case, have equal
+        keys. Any word of more than two characters has at least three.
+    """
+    length = numpy.minimum(ends - starts, 255)
+    key = length << 24 | (padded[starts] | 0x20) << 16 | (padded[starts + 1] | 0x20) << 8
+    third = length > 2
+    key[third] |= padded[starts[third] + 2] | 0x20
+    return key
+
+
+_reserved = []
+
+
+def _reserved_keys():
+    """ Returns the keys, as per _word_keys, of the reserved words.
+    """
+    if not _reserved:
+        words = list(lexer._reserved_codes)
+        padded = numpy.array([ord(c) for c in "\0".join(words) + "\0"], dtype=numpy.int64)
+        starts = numpy.cumsum([0] + [len(word) + 1 for word in words[:-1]])
+        ends = starts + [len(word) for word in words]
+        _reserved.append(_word_keys(padded, starts, ends))
+    return _reserved[0]
+
+
+def lex_text(text, binary=False):
+    """ Returns the token_buffer of text, as per a lex_file reading text in
+        bulk, in byte mode if binary. Returns None if NumPy is not available,
+        or, when not binary, text is not all ASCII.
+    """
+    if numpy is None or not (binary or text.isascii()):
+        return None
+
+    classes, is_space, punctuation = _get_tables(binary)
+    data = numpy.frombuffer(text.encode("latin-1"), dtype=numpy.uint8)
+    size = len(data)
+
+    pieces = []
+    line_count = 0
+    base = 0
+    while base < size:
+        end = min(base + chunk_size, size)
+        if end < size:
+            new_line = text.find('\n', end)
+            end = size if new_line < 0 else new_line + 1
+
+        pieces.append(_lex_chunk(text, data[base:end], base, line_count,
+                                 classes, is_space, punctuation))
+        line_count += text.count('\n', base, end)
+        base = end
+
+    if size > 0 and text[-1] != '\n':
+        line_count += 1
+
+    result = lexer.token_buffer()
+    result.text = text
+    result.eof_line_number = line_count + 1
+    result.eof_col_number = 1
+    if pieces:
+        kinds, starts, ends, lines, cols = (numpy.concatenate(part) for part in zip(*pieces))
+        result.kinds = array("B", kinds.tobytes())
+        result.starts = array("l", starts.astype("l").tobytes())
+        result.ends = array("l", ends.astype("l").tobytes())
+        result.lines = array("l", lines.astype("l").tobytes())
+        result.cols = array("l", cols.astype("l").tobytes())
+    return result
+
+
+def _lex_chunk(text, data, base, line_count, classes, is_space, punctuation):
+    """ Returns the (kinds, starts, ends, lines, cols) arrays of the items of
+        data, the characters of text from offset base, which start a line,
+        line number line_count + 1, and end at the end of a line.
+    """
+    size = len(data)
+    position = numpy.arange(size + 1, dtype=numpy.int64)
+    padded = numpy.append(data, 0).astype(numpy.int64)
+    padded[size] = 256      # a sentinel of class C_Other, which is not space
+    kind = classes[padded]
+
+    # The lines, and the end of each line's content, excluding trailing white
+    # space, as per lexer.get_next_indexed_line.
+    #
+    new_lines = numpy.flatnonzero(kind == C_New_Line)
+    line_starts = numpy.concatenate(([0], new_lines + 1))
+    line_ends = numpy.concatenate((new_lines, [size]))
+    if line_starts[-1] == size:
+        line_starts = line_starts[:-1]
+        line_ends = line_ends[:-1]
+
+    last_solid = numpy.maximum.accumulate(numpy.where(is_space[padded], -1, position))
+    last = last_solid[numpy.maximum(line_ends - 1, 0)]
+    content_ends = numpy.where((line_ends > line_starts) & (last >= line_starts),
+                               last + 1, line_starts)
+
+    line_of = numpy.cumsum(kind == C_New_Line) - (kind == C_New_Line)
+    line_of[size] = 0
+    valid = position < content_ends[line_of]
+    valid[size] = False
+
+    # Strings, comments and macros. Each may start at any quote, hash or $(
+    # that is not within a previous one, so the end of each such opener is
+    # found, and then the chain of items from the first opener of each line,
+    # each starting at the first opener after the end of the previous one.
+    #
+    next_char = numpy.append(padded[1:], 256)
+    openers = numpy.flatnonzero(valid & ((kind == C_Quote) | (kind == C_Hash) |
+                                         ((kind == C_Dollar) & (next_char == ord('(')))))
+    opener_lines = line_of[openers]
+    opener_kind = kind[openers]
+    limits = content_ends[opener_lines]
+
+    hard_kinds = numpy.full(len(openers), lex_codes.Lk_Comment, dtype=numpy.uint8)
+    hard_ends = limits.copy()
+
+    macros = opener_kind == C_Dollar
+    hard_kinds[macros] = lex_codes.Lk_Macro
+    close = _next_false(padded != ord(')'))[openers[macros]]
+    hard_ends[macros] = numpy.minimum(close + 1, limits[macros])
+
+    # A string ends at the next quote, unless a back slash comes first, which
+    # (rarely) requires the scanner's pattern.
+    #
+    strings = numpy.flatnonzero(opener_kind == C_Quote)
+    hard_kinds[strings] = lex_codes.Lk_String
+    after = openers[strings] + 1
+    quote = _next_false(kind != C_Quote)[after]
+    slash = _next_false(padded != ord('\\'))[after]
+    hard_ends[strings] = numpy.minimum(quote + 1, limits[strings])
+    escaped = slash < numpy.minimum(quote, limits[strings])
+    for index, start, end in zip(strings[escaped].tolist(), openers[strings[escaped]].tolist(),
+                                 limits[strings[escaped]].tolist()):
+        hard_ends[index] = _string.match(text, base + start, base + end).end() - base
+
+    following = numpy.searchsorted(openers, hard_ends)
+    following[following >= len(openers)] = 0
+    following = numpy.where(opener_lines[following] == opener_lines, following, -1)
+    following[following == 0] = -1
+
+    active = numpy.flatnonzero(numpy.diff(opener_lines, prepend=-1) != 0)
+    chain = []
+    while active.size:
+        chain.append(active)
+        active = following[active]
+        active = active[active >= 0]
+
+    chain = numpy.sort(numpy.concatenate(chain)) if chain else numpy.zeros(0, dtype=numpy.int64)
+    hard_starts = openers[chain]
+    hard_ends = hard_ends[chain]
+    hard_kinds = hard_kinds[chain]
+
+    depth = numpy.zeros(size + 2, dtype=numpy.int64)
+    numpy.add.at(depth, hard_starts, 1)
+    numpy.add.at(depth, hard_ends, -1)
+    in_hard = numpy.cumsum(depth)[:size + 1] > 0
+
+    # All other items lie within runs of simple characters, each run
+    # starting a new item. Each pass finds the end of the next item in every
+    # run that is not yet done.
+    #
+    simple = valid & ~in_hard & (kind != C_Space)
+    simple[size] = False
+    run_ends = _next_false(simple)
+    word_ends = _next_false((kind == C_Alpha) | (kind == C_Digit) | (kind == C_Colon))
+    digit_ends = _next_false(kind == C_Digit)
+    is_point = padded == ord('.')
+    is_exponent = (padded == ord('e')) | (padded == ord('E'))
+    is_sign = (padded == ord('+')) | (padded == ord('-'))
+
+    active = numpy.flatnonzero(simple & ~numpy.concatenate(([False], simple[:-1])))
+    limits = run_ends[active]
+    simple_starts = []
+    simple_ends = []
+    while active.size:
+        ends = active + 1
+        item_kind = kind[active]
+
+        words = item_kind == C_Alpha
+        ends[words] = word_ends[active[words] + 1]
+
+        numbers = item_kind == C_Digit
+        if numbers.any():
+            at = digit_ends[active[numbers]]
+            at = digit_ends[at + is_point[at]]
+            at = at + is_exponent[at]
+            at = digit_ends[at + is_sign[at]]
+            ends[numbers] = at
+
+        ends = numpy.minimum(ends, limits)
+        simple_starts.append(active)
+        simple_ends.append(ends)
+
+        more = ends < limits
+        active = ends[more]
+        limits = limits[more]
+
+    if simple_starts:
+        simple_starts = numpy.concatenate(simple_starts)
+        simple_ends = numpy.concatenate(simple_ends)
+    else:
+        simple_starts = simple_ends = numpy.zeros(0, dtype=numpy.int64)
+
+    item_kind = kind[simple_starts]
+    simple_kinds = numpy.where(item_kind == C_Digit, lex_codes.Lk_Number,
+                               numpy.where(item_kind == C_Alpha, lex_codes.Lk_Identifier,
+                                           punctuation[padded[simple_starts]]))
+
+    # The identifiers which are reserved words.
+    #
+    reserved = lexer._reserved_codes
+    identifier_code = lexer._identifier_code
+    identifiers = numpy.flatnonzero(simple_kinds == identifier_code)
+    identifiers = identifiers[numpy.isin(_word_keys(padded, simple_starts[identifiers],
+                                                    simple_ends[identifiers]),
+                                         _reserved_keys())]
+    codes = [reserved.get(text[base + start:base + end].lower(), identifier_code)
+             for start, end in zip(simple_starts[identifiers].tolist(),
+                                   simple_ends[identifiers].tolist())]
+    simple_kinds = simple_kinds.astype(numpy.uint8)
+    simple_kinds[identifiers] = codes
+
+    # Merge the two sets of items by start offset.
+    #
+    starts = numpy.concatenate((simple_starts, hard_starts))
+    order = numpy.argsort(starts, kind="stable")
+    starts = starts[order]
+    ends = numpy.concatenate((simple_ends, hard_ends))[order]
+    kinds = numpy.concatenate((simple_kinds, hard_kinds))[order]
+
+    lines = line_of[starts]
+    cols = starts - line_starts[lines] + 1
+    return kinds, starts + base, ends + base, lines + line_count + 1, cols
+
+# end
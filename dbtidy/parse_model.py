@@ -0,0 +1,762 @@
+""" This module provides the parse model: a document tree of the definitions in
+    a database or dbd file, i.e. records, aliases, recordtypes, menus, devices,
+    drivers etc., together with their fields, info items, choices and so on,
+    built in one pass over a token_buffer.
+
+    Each definition is a node: a keyword, e.g. record, any (arguments), and any
+    { body } of child nodes. Nodes hold just the token indices of their extent
+    within the token_buffer, whose start and end offsets locate each value in
+    the source text, and values are only extracted, and unquoted, on access.
+    Any token that is not part of a recognised definition, e.g. a stray brace,
+    is a node by itself, so every token of the file belongs to exactly one
+    node, and the document yields exactly the token_buffer's tokens, in order.
+    So the formatter may render the document, or any node, directly.
+
+    Comments are kept with the node they belong to:
+    a) comments, each on its own line, immediately before a node (with no
+       blank line in between) lead that node;
+    b) an end of line comment straight after a node is that node's trailing
+       comment; and
+    c) any other comment, e.g. the last comments of a record's body, is an
+       inner comment of the enclosing node, or the document.
+"""
+
+import io
+
+from . import common
+from . import dbtidy_lib
+from . import lexer
+
+lex_codes = lexer.lex_codes
+kind_of_code = lexer.kind_of_code
+
+
+def _is_word(code):
+    return code == lex_codes.Lk_Identifier or code >= lex_codes.Rw_Alias
+
+
+_openers = (lex_codes.Lk_Open_Brace, lex_codes.Lk_Open_Square)
+_closers = (lex_codes.Lk_Close_Brace, lex_codes.Lk_Close_Square)
+
+
+def _argument_end(kinds, open_index):
+    """ Returns (end, closed) for the arguments started by the '(' at
+        open_index: the index just after the matching ')', and True, or, if
+        malformed, the index at which the arguments were cut short, and False.
+        Braces and brackets are allowed within an argument, e.g. a JSON link,
+        but only if the argument starts with one. An unmatched brace or bracket
+        ends the arguments, so a missing ')' does not swallow the body.
+    """
+    count = len(kinds)
+    parens = 1
+    nested = 0
+    previous = lex_codes.Lk_Open_Round
+    index = open_index + 1
+    while index < count:
+        code = kinds[index]
+        if code == lex_codes.Lk_Comment:
+            index += 1
+            continue
+
+        if nested > 0:
+            if code in _openers:
+                nested += 1
+            elif code in _closers:
+                nested -= 1
+
+        elif code == lex_codes.Lk_Close_Round:
+            parens -= 1
+            if parens == 0:
+                return index + 1, True
+
+        elif code == lex_codes.Lk_Open_Round:
+            parens += 1
+
+        elif code in _openers:
+            if previous not in (lex_codes.Lk_Open_Round, lex_codes.Lk_Comma):
+                return index, False
+            nested = 1
+
+        elif code in _closers:
+            return index, False
+
+        previous = code
+        index += 1
+
+    return index, False
+
+
+# -----------------------------------------------------------------------------
+#
+class node (object):
+    """ A definition, or a token on its own, within a document. The token
+        indices are: first, that of the first leading comment, if any, else
+        that of the keyword; start, that of the keyword; and last, that of the
+        last token, including any trailing comment. The children are the
+        nodes of the body, a list, or () if the node has no body.
+    """
+
+    __slots__ = ("buffer", "parent", "first", "start", "last", "children")
+
+    def __init__(self, buffer, parent, first, start):
+        self.buffer = buffer
+        self.parent = parent
+        self.first = first
+        self.start = start
+        self.last = start
+        self.children = ()
+
+
+    def __repr__(self):
+        return "<%s %s%r at %d:%d>" % (type(self).__name__, self.keyword,
+                                       tuple(self.arguments()),
+                                       self.line_number, self.col_number)
+
+
+    @property
+    def kind(self):
+        """ The lex_kinds of the keyword, e.g. lex_kinds.Rw_Record.
+        """
+        return kind_of_code[self.buffer.kinds[self.start]]
+
+
+    @property
+    def keyword(self):
+        """ The keyword, e.g. "record", as is.
+        """
+        return self.buffer.value(self.start)
+
+
+    @property
+    def line_number(self):
+        return self.buffer.lines[self.start]
+
+
+    @property
+    def col_number(self):
+        return self.buffer.cols[self.start]
+
+
+    @property
+    def has_body(self):
+        return isinstance(self.children, list)
+
+
+    @property
+    def text(self):
+        """ The node's source text, from any leading comment to the last token.
+        """
+        buffer = self.buffer
+        return buffer.text[buffer.starts[self.first]:buffer.ends[self.last]]
+
+
+    # -------------------------------------------------------------------------
+    # Arguments.
+    #
+    def argument_tokens(self):
+        """ Returns the list of the token indices of each argument, excluding
+            any comments. A keyword followed by just a string, e.g. include
+            "file.dbd", has that string as its only argument.
+        """
+        kinds = self.buffer.kinds
+        index = self.start + 1
+        if index > self.last or not _is_word(kinds[self.start]):
+            return []
+
+        if kinds[index] == lex_codes.Lk_String:
+            return [[index]]
+
+        if kinds[index] != lex_codes.Lk_Open_Round:
+            return []
+
+        end, closed = _argument_end(kinds, index)
+        if closed:
+            end -= 1
+
+        result = [[]]
+        parens = 0
+        nested = 0
+        for index in range(index + 1, end):
+            code = kinds[index]
+            if code == lex_codes.Lk_Comment:
+                continue
+            if code in _openers:
+                nested += 1
+            elif code in _closers:
+                nested -= 1
+            elif code == lex_codes.Lk_Open_Round:
+                parens += 1
+            elif code == lex_codes.Lk_Close_Round:
+                parens -= 1
+            elif code == lex_codes.Lk_Comma and parens == 0 and nested == 0:
+                result.append([])
+                continue
+            result[-1].append(index)
+
+        if result == [[]]:
+            return []
+        return result
+
+
+    def decode(self, indices):
+        """ Returns the value of an argument, given its token indices: the
+            source text from its first to its last token, with the quotes
+            removed if just a string.
+        """
+        if not indices:
+            return ""
+        buffer = self.buffer
+        if len(indices) == 1 and buffer.kinds[indices[0]] == lex_codes.Lk_String:
+            return lexer.unquote(buffer.value(indices[0]))
+        return buffer.text[buffer.starts[indices[0]]:buffer.ends[indices[-1]]]
+
+
+    def arguments(self):
+        """ Returns the list of argument values, see decode.
+        """
+        return [self.decode(indices) for indices in self.argument_tokens()]
+
+
+    def argument(self, number, default=None):
+        """ Returns the value of the number-th (from 0) argument, or default.
+        """
+        arguments = self.argument_tokens()
+        if number < len(arguments):
+            return self.decode(arguments[number])
+        return default
+
+
+    # -------------------------------------------------------------------------
+    # Comments.
+    #
+    @property
+    def comments(self):
+        """ The list of leading comments.
+        """
+        buffer = self.buffer
+        return [buffer.value(index) for index in range(self.first, self.start)]
+
+
+    @property
+    def trailing_comment(self):
+        """ The end of line comment straight after the node, or None.
+        """
+        buffer = self.buffer
+        last = self.last
+        if last > self.start and buffer.kinds[last] == lex_codes.Lk_Comment and \
+                buffer.lines[last] == buffer.lines[last - 1]:
+            return buffer.value(last)
+        return None
+
+
+    def inner_comments(self):
+        """ Returns the list of the comments within the node that belong to
+            no child, and are neither leading nor trailing comments.
+        """
+        buffer = self.buffer
+        kinds = buffer.kinds
+        last = self.last
+        if self.trailing_comment is not None:
+            last -= 1
+
+        result = []
+        position = self.start
+        for child in list(self.children) + [None]:
+            stop = last + 1 if child is None else child.first
+            result.extend(buffer.value(index) for index in range(position, stop)
+                          if kinds[index] == lex_codes.Lk_Comment)
+            if child is not None:
+                position = child.last + 1
+        return result
+
+
+    # -------------------------------------------------------------------------
+    # Children.
+    #
+    def nodes(self, node_class=None):
+        """ Generates the child nodes, or just those of node_class.
+        """
+        for child in self.children:
+            if node_class is None or isinstance(child, node_class):
+                yield child
+
+
+    def walk(self):
+        """ Generates all the nodes within this node, depth first, in order.
+        """
+        stack = [iter(self.children)]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+            else:
+                yield child
+                if child.children:
+                    stack.append(iter(child.children))
+
+
+    def find(self, keyword):
+        """ Returns the first child node with the given keyword (in any case),
+            or None.
+        """
+        keyword = keyword.lower()
+        for child in self.children:
+            if child.keyword.lower() == keyword:
+                return child
+        return None
+
+
+    # -------------------------------------------------------------------------
+    # Tokens, and rendering.
+    #
+    def token_ranges(self):
+        """ Generates the (start, stop) token index ranges, in order, that
+            together make up this node, any children included.
+        """
+        stack = [[self, iter(self.children), self.first]]
+        while stack:
+            entry = stack[-1]
+            child = next(entry[1], None)
+            if child is None:
+                stack.pop()
+                if entry[2] <= entry[0].last:
+                    yield entry[2], entry[0].last + 1
+            else:
+                if entry[2] < child.first:
+                    yield entry[2], child.first
+                entry[2] = child.last + 1
+                stack.append([child, iter(child.children), child.first])
+
+
+    def tokens(self):
+        """ As per lex_file.tokens, generates the node's tokens, so that a node
+            may be formatted as a source.
+        """
+        buffer = self.buffer
+        text = buffer.text
+        kinds = buffer.kinds
+        starts = buffer.starts
+        ends = buffer.ends
+        lines = buffer.lines
+        cols = buffer.cols
+        for start, stop in self.token_ranges():
+            for index in range(start, stop):
+                yield (kinds[index], text[starts[index]:ends[index]],
+                       lines[index], cols[index])
+
+
+    def first_line(self):
+        """ The line number, as used by layout, of the node's first line.
+        """
+        if self.first >= len(self.buffer):
+            return 1
+        return self.buffer.lines[self.first]
+
+
+    def layout(self, stats=None, names=None, schema=None):
+        """ Returns the layout line records of the node, as per
+            dbtidy_lib.layout, with names and schema as per process. A node
+            within a document is laid out as per range formatting, i.e. as if
+            it started the file, but with the warnings' line numbers as is.
+        """
+        first_line = self.first_line()
+        source = dbtidy_lib.observe(self, stats, names, schema)
+        if first_line != 1:
+            source = _line_shift(source, first_line - 1)
+        return dbtidy_lib.layout(source, stats, first_line)
+
+
+class _line_shift (object):
+    """ Shifts the line numbers of a source's tokens down by shift.
+    """
+
+    def __init__(self, source, shift):
+        self.source = source
+        self.shift = shift
+
+
+    def tokens(self):
+        shift = self.shift
+        for code, value, line_number, col_number in self.source.tokens():
+            yield code, value, line_number - shift, col_number
+
+
+# -----------------------------------------------------------------------------
+#
+class record_node (node):
+    """ record(type, name) or grecord(type, name), with field, info and alias
+        children.
+    """
+
+    __slots__ = ()
+
+    @property
+    def record_type(self):
+        return self.argument(0)
+
+
+    @property
+    def name(self):
+        return self.argument(1)
+
+
+    def fields(self):
+        return list(self.nodes(field_node))
+
+
+    def infos(self):
+        return list(self.nodes(info_node))
+
+
+    def aliases(self):
+        return list(self.nodes(alias_node))
+
+
+    def field(self, name, default=None):
+        """ Returns the value of the (last) field called name, or default.
+        """
+        value = default
+        for child in self.nodes(field_node):
+            if child.name == name:
+                value = child.value
+        return value
+
+
+class field_node (node):
+    """ field(name, value) within a record, or, within a recordtype,
+        field(name, type) with a body of prompt, promptgroup, special etc.
+        attributes.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+    @property
+    def value(self):
+        return self.argument(1)
+
+
+    @property
+    def type(self):
+        return self.argument(1)
+
+
+    def attribute(self, keyword, default=None):
+        """ Returns the (first) argument of the attribute with the given
+            keyword, e.g. "promptgroup", or default.
+        """
+        child = self.find(keyword)
+        if child is None:
+            return default
+        return child.argument(0, default)
+
+
+class info_node (node):
+    """ info(name, value) within a record.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+    @property
+    def value(self):
+        return self.argument(1)
+
+
+class alias_node (node):
+    """ alias(name) within a record, or alias(target, name) at the top level.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        arguments = self.arguments()
+        return arguments[-1] if arguments else None
+
+
+    @property
+    def target(self):
+        arguments = self.arguments()
+        if len(arguments) >= 2:
+            return arguments[0]
+        if isinstance(self.parent, record_node):
+            return self.parent.name
+        return None
+
+
+class record_type_node (node):
+    """ recordtype(name), with field definition children.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+    def fields(self):
+        return list(self.nodes(field_node))
+
+
+class menu_node (node):
+    """ menu(name), with choice children.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+    def choices(self):
+        return list(self.nodes(choice_node))
+
+
+class choice_node (node):
+    """ choice(name, value) within a menu.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+    @property
+    def value(self):
+        return self.argument(1)
+
+
+class device_node (node):
+    """ device(record type, link type, dset name, choice string).
+    """
+
+    __slots__ = ()
+
+    @property
+    def record_type(self):
+        return self.argument(0)
+
+
+    @property
+    def link_type(self):
+        return self.argument(1)
+
+
+    @property
+    def dset(self):
+        return self.argument(2)
+
+
+    @property
+    def choice(self):
+        return self.argument(3)
+
+
+class driver_node (node):
+    """ driver(name).
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.argument(0)
+
+
+_node_classes = {
+    lex_codes.Rw_Record:      record_node,
+    lex_codes.Rw_Grecord:     record_node,
+    lex_codes.Rw_Field:       field_node,
+    lex_codes.Rw_Info:        info_node,
+    lex_codes.Rw_Alias:       alias_node,
+    lex_codes.Rw_Record_Type: record_type_node,
+    lex_codes.Rw_Menu:        menu_node,
+    lex_codes.Rw_Choice:      choice_node,
+    lex_codes.Rw_Device:      device_node,
+    lex_codes.Rw_Driver:      driver_node
+}
+
+
+# -----------------------------------------------------------------------------
+#
+class document (node):
+    """ The root of the model: the top level nodes of a whole file, which
+        hold the token_buffer, and so the source text.
+    """
+
+    __slots__ = ("filename",)
+
+    def __init__(self, buffer, filename=None):
+        node.__init__(self, buffer, None, 0, 0)
+        self.filename = filename
+        self.last = len(buffer) - 1
+        self.children = []
+
+
+    def __repr__(self):
+        return "<document %s of %d nodes>" % (self.filename, len(self.children))
+
+
+    def first_line(self):
+        return 1
+
+
+    def records(self):
+        return list(self.nodes(record_node))
+
+
+    def record_types(self):
+        return list(self.nodes(record_type_node))
+
+
+    def menus(self):
+        return list(self.nodes(menu_node))
+
+
+    def devices(self):
+        return list(self.nodes(device_node))
+
+
+    def drivers(self):
+        return list(self.nodes(driver_node))
+
+
+    def aliases(self):
+        """ Returns all the aliases, both top level and within records.
+        """
+        return [item for item in self.walk() if isinstance(item, alias_node)]
+
+
+# -----------------------------------------------------------------------------
+#
+def parse(buffer, filename=None):
+    """ Returns the document of buffer, a token_buffer.
+    """
+    kinds = buffer.kinds
+    lines = buffer.lines
+    count = len(kinds)
+
+    top = document(buffer, filename)
+    container = top
+    stack = []
+    pending = -1        # the first of any comments, each on its own line, since the last node
+    completed = None    # the node, if any, that ended with the previous token
+
+    index = 0
+    while index < count:
+        code = kinds[index]
+
+        if code == lex_codes.Lk_Comment:
+            if index > 0 and lines[index] == lines[index - 1]:
+                # End of line comment.
+                #
+                if completed is not None and completed.last == index - 1:
+                    completed.last = index
+            elif pending < 0 or lines[index] > lines[index - 1] + 1:
+                pending = index
+            index += 1
+            continue
+
+        completed = None
+        if code == lex_codes.Lk_Close_Brace and stack:
+            container.last = index
+            completed = container
+            container = stack.pop()
+            pending = -1
+            index += 1
+            continue
+
+        first = index
+        if pending >= 0 and lines[index] <= lines[index - 1] + 1:
+            first = pending
+        pending = -1
+
+        item = _node_classes.get(code, node)(buffer, container, first, index)
+        container.children.append(item)
+        index += 1
+
+        if _is_word(code) and index < count:
+            if kinds[index] == lex_codes.Lk_Open_Round:
+                index = _argument_end(kinds, index)[0]
+            elif kinds[index] == lex_codes.Lk_String:
+                index += 1
+
+            # Any comments before the body are inner comments.
+            #
+            body = index
+            while body < count and kinds[body] == lex_codes.Lk_Comment:
+                body += 1
+            if body < count and kinds[body] == lex_codes.Lk_Open_Brace:
+                item.children = []
+                stack.append(container)
+                container = item
+                index = body + 1
+                continue
+
+        item.last = index - 1
+        completed = item
+
+    # Any bodies still open run to the end of the file.
+    #
+    while stack:
+        container.last = count - 1
+        container = stack.pop()
+
+    return top
+
+
+def parse_file(filename, bulk=True, source=None, stats=None, binary=False):
+    """ Returns the document of filename, or of source if specified, as read
+        by lex_file.
+    """
+    with lexer.lex_file(filename, bulk, source, stats, binary) as lex:
+        return parse(lex.get_token_buffer(), filename)
+
+
+def parse_data(filename, data, binary=False):
+    """ Returns the document of data (bytes), the content of filename, read
+        as per process_data.
+    """
+    return parse_file(filename, True, dbtidy_lib.data_stream(data, binary), binary=binary)
+
+
+# -----------------------------------------------------------------------------
+#
+def render(item, target, stats=None, names=None, schema=None):
+    """ Formats item, a document or any node, and writes the output to target,
+        as per dbtidy_lib.process. Any warnings are given the document's
+        filename.
+    """
+    root = item
+    while root.parent is not None:
+        root = root.parent
+
+    saved_name = common.source_file_name
+    common.source_file_name = root.filename or "<document>"
+    try:
+        dbtidy_lib.render(item.layout(stats, names, schema), target)
+    finally:
+        common.source_file_name = saved_name
+
+
+def render_text(item, stats=None):
+    """ Returns the formatted text of item, a document or any node.
+    """
+    target = io.StringIO()
+    render(item, target, stats)
+    return target.getvalue()
+
+# end
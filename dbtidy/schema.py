@@ -0,0 +1,330 @@
+""" This module provides the record type schema: the fields of each record
+    type, and their promptgroup and special attributes, as defined by the
+    recordtype definitions in a set of .dbd files. These are read using the
+    dbtidy lexer, following any include files. The schema is cached on disk,
+    and only re-read if any of the .dbd files are modified.
+    The schema is used to warn about unknown record types and fields.
+"""
+
+import hashlib
+import marshal
+import os
+import os.path
+import sys
+
+from . import __version__
+from . import cache
+from . import common
+from . import dbtidy_lib
+from . import lexer
+
+lex_codes = lexer.lex_codes
+lex_items = lexer.lex_items
+kind_of_code = lexer.kind_of_code
+
+# Increment if the cached content changes.
+#
+schema_version = 1
+
+# Schemas loaded so far by this process, keyed by the dbd files and paths.
+#
+_loaded = {}
+
+# The sources entry of an include file that could not be found.
+#
+missing = (-1, -1)
+
+
+# -----------------------------------------------------------------------------
+#
+class declaration_reader (object):
+    """ Reads declarations, i.e. keyword(arg, ...), from tokens pushed one at
+        a time, and calls handler(depth, code, args, line, col) for each,
+        where depth is the brace depth, code the keyword's kind code, and args
+        the list of argument values, with any quotes removed.
+        Only keywords with codes in keywords are read.
+    """
+
+    def __init__(self, keywords, handler):
+        self.keywords = keywords
+        self.handler = handler
+        self.depth = 0
+        self.call = None
+        self.parens = 0
+        self.args = []
+
+
+    def push(self, item):
+        code, value, line_number, col_number = item
+
+        if self.call is not None:
+            if self.parens == 0:
+                if code == lex_codes.Lk_Open_Round:
+                    self.parens = 1
+                    self.args = [[]]
+                    return
+                self.call = None    # malformed - ignore
+
+            elif code == lex_codes.Lk_Close_Round and self.parens == 1:
+                keyword, line, col = self.call
+                self.call = None
+                self.handler(self.depth, keyword, [lexer.unquote(''.join(arg)) for arg in self.args],
+                             line, col)
+                return
+
+            elif code == lex_codes.Lk_Comma and self.parens == 1:
+                self.args.append([])
+                return
+
+            elif code in (lex_codes.Lk_Open_Brace, lex_codes.Lk_Close_Brace):
+                self.call = None    # malformed - ignore
+
+            else:
+                if code == lex_codes.Lk_Open_Round:
+                    self.parens += 1
+                elif code == lex_codes.Lk_Close_Round:
+                    self.parens -= 1
+                self.args[-1].append(value)
+                return
+
+        if code in self.keywords:
+            self.call = (code, line_number, col_number)
+            self.parens = 0
+
+        elif code == lex_codes.Lk_Open_Brace:
+            self.depth += 1
+
+        elif code == lex_codes.Lk_Close_Brace:
+            self.depth = max(0, self.depth - 1)
+
+
+# -----------------------------------------------------------------------------
+#
+class record_schema (object):
+    """ Maps each record type name to its fields, each a dict of field name
+        to (field type, promptgroup, special), where promptgroup and special
+        are None if not defined. The sources are the (size, mtime_ns) of each
+        of the .dbd files read, or missing for an include file not found,
+        keyed by path.
+    """
+
+    def __init__(self, types=None, sources=None):
+        self.types = types if types is not None else {}
+        self.sources = sources if sources is not None else {}
+
+
+    def is_current(self):
+        """ Returns True if none of the source files have been modified, and
+            no missing include file has since been created.
+        """
+        for path, entry in self.sources.items():
+            try:
+                info = os.stat(path)
+            except OSError:
+                if entry == missing:
+                    continue
+                return False
+            if entry != (info.st_size, info.st_mtime_ns):
+                return False
+        return True
+
+
+    def read_dbd(self, filename, include_paths=()):
+        """ Adds the record types defined by filename, and any files it
+            includes, which are looked for in the including file's directory
+            and then in include_paths.
+        """
+        current = {"type": None, "field": None}
+
+        def handler(depth, code, args, line, col):
+            if code == lex_codes.Rw_Record_Type and depth == 0 and args:
+                current["type"] = self.types.setdefault(args[0], {})
+                current["field"] = None
+
+            elif code == lex_codes.Rw_Field and depth == 1 and len(args) == 2 and \
+                    current["type"] is not None:
+                current["field"] = [args[1], None, None]
+                current["type"][args[0]] = current["field"]
+
+            elif depth == 2 and args and current["field"] is not None:
+                if code == lex_codes.Rw_Prompt_Group:
+                    current["field"][1] = args[0]
+                elif code == lex_codes.Rw_Special:
+                    current["field"][2] = args[0]
+
+        reader = declaration_reader((lex_codes.Rw_Record_Type, lex_codes.Rw_Field,
+                                     lex_codes.Rw_Prompt_Group, lex_codes.Rw_Special),
+                                    handler)
+        self.read_file(filename, include_paths, reader)
+
+        # Freeze the field attributes.
+        #
+        for fields in self.types.values():
+            for name, attributes in fields.items():
+                fields[name] = tuple(attributes)
+
+
+    def read_file(self, filename, include_paths, reader):
+        info = os.stat(filename)
+        self.sources[os.path.abspath(filename)] = (info.st_size, info.st_mtime_ns)
+
+        directory = os.path.dirname(filename)
+        saved_name = common.source_file_name
+        common.source_file_name = filename
+        try:
+            self.read_tokens(filename, directory, include_paths, reader)
+        finally:
+            common.source_file_name = saved_name
+
+
+    def read_tokens(self, filename, directory, include_paths, reader):
+        include = None
+        with lexer.lex_file(filename, True) as source:
+            for item in source.tokens():
+                code, value = item[0], item[1]
+                if include is not None:
+                    if code == lex_codes.Lk_String:
+                        self.read_include(lexer.unquote(value), directory, include_paths,
+                                          reader, include)
+                        include = None
+                        continue
+                    include = None
+
+                if code == lex_codes.Rw_Include:
+                    include = item
+                    continue
+
+                reader.push(item)
+
+
+    def read_include(self, name, directory, include_paths, reader, item):
+        for path in (directory,) + tuple(include_paths):
+            filename = os.path.join(path, name)
+            if os.path.isfile(filename):
+                self.read_file(filename, include_paths, reader)
+                return
+
+        self.sources[os.path.abspath(os.path.join(directory, name))] = missing
+        dbtidy_lib.warning(lex_items(kind_of_code[item[0]], item[1], item[2], item[3]),
+                           "cannot find include file: %s" % name)
+
+
+    def checker(self, stats=None):
+        """ Returns a schema_checker for this schema.
+        """
+        return schema_checker(self, stats)
+
+
+# -----------------------------------------------------------------------------
+#
+class schema_checker (object):
+    """ Checks the record types and field names of the record definitions in
+        the tokens of a source against a record_schema, as the tokens are passed
+        on, unchanged, via tokens, e.g. to layout. Names that include macros are
+        not checked. If stats, a file_stats, is specified, the warnings are
+        counted.
+    """
+
+    def __init__(self, schema, stats=None):
+        self.schema = schema
+        self.stats = stats
+        self.record_type = None
+        self.fields = None
+        self.items = iter(())
+        self.reader = declaration_reader((lex_codes.Rw_Record, lex_codes.Rw_Grecord,
+                                          lex_codes.Rw_Field), self.declared)
+
+
+    def attach(self, source):
+        """ Attaches the source, e.g. a lex_file or token_buffer; returns self.
+        """
+        self.items = source.tokens()
+        return self
+
+
+    def tokens(self):
+        """ As per lex_file.tokens.
+        """
+        push = self.reader.push
+        for item in self.items:
+            push(item)
+            yield item
+
+
+    def warning(self, code, line, col, text):
+        if self.stats is not None:
+            self.stats.warnings += 1
+        dbtidy_lib.warning(lex_items(kind_of_code[code], "", line, col), text)
+
+
+    def declared(self, depth, code, args, line, col):
+        if code == lex_codes.Rw_Field:
+            if depth == 1 and args and self.fields is not None:
+                name = args[0]
+                if '$' not in name and name not in self.fields:
+                    self.warning(code, line, col, "unknown field for record type %s: %s" %
+                                 (self.record_type, name))
+
+        elif depth == 0 and args:
+            self.record_type = args[0]
+            self.fields = None
+            if '$' not in self.record_type:
+                self.fields = self.schema.types.get(self.record_type)
+                if self.fields is None:
+                    self.warning(code, line, col, "unknown record type: %s" % self.record_type)
+
+
+# -----------------------------------------------------------------------------
+#
+def cache_filename(key):
+    """ Returns the schema cache file name for key.
+    """
+    digest = hashlib.blake2b(repr(key).encode("utf-8", "surrogateescape"),
+                             digest_size=8).hexdigest()
+    return os.path.join(os.path.dirname(cache.default_filename()),
+                        "schema-%s.marshal" % digest)
+
+
+def load(filenames, include_paths=(), use_cache=True):
+    """ Returns the record_schema defined by the .dbd filenames, from the
+        on disk cache if available and up to date. A schema is only loaded
+        once per process.
+    """
+    key = (tuple(os.path.abspath(filename) for filename in filenames),
+           tuple(os.path.abspath(path) for path in include_paths))
+    schema = _loaded.get(key)
+    if schema is not None:
+        return schema
+
+    filename = cache_filename(key) if use_cache else None
+    if filename is not None:
+        try:
+            with open(filename, 'rb') as f:
+                content = marshal.load(f)
+            if content[:3] == (schema_version, __version__, key):
+                schema = record_schema(content[4], content[3])
+                if not schema.is_current():
+                    schema = None
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            schema = None
+
+    if schema is None:
+        schema = record_schema()
+        for dbd_filename in filenames:
+            schema.read_dbd(dbd_filename, include_paths)
+
+        if filename is not None:
+            try:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                temp = "%s.%d" % (filename, os.getpid())
+                with open(temp, 'wb') as f:
+                    marshal.dump((schema_version, __version__, key,
+                                  schema.sources, schema.types), f)
+                os.replace(temp, filename)
+            except OSError as error:
+                sys.stderr.write("cannot save schema cache: %s\n" % error)
+
+    _loaded[key] = schema
+    return schema
+
+# end
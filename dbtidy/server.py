@@ -0,0 +1,298 @@
+""" This module provides the dbtidy server, a long lived process that keeps
+    dbtidy loaded and tidies text or files on request, so that editors, git
+    hooks and the like avoid the start up cost of each dbtidy invocation.
+
+    The protocol is JSON-RPC 2.0, one JSON object per line, over either the
+    standard input and output or a Unix domain socket. The methods are:
+
+      tidy       params: text, [filename], [lines]
+                 result: text, changed, warnings
+      tidy_file  params: path, [lines], [check]
+                 result: changed (or tidy when checking), warnings
+      version    result: the dbtidy version
+      shutdown   stops the server once the response is sent.
+
+    where lines, if specified, is a [first, last] line range, as per the
+    --lines option, and warnings is the list of warning messages.
+"""
+
+import collections
+import contextlib
+import inspect
+import io
+import json
+import os
+import os.path
+import socket
+import sys
+
+from . import __version__
+from . import cache
+from . import common
+from . import dbtidy_lib
+from . import main
+
+
+def default_address():
+    """ Returns the default socket file name, in the XDG run time directory if
+        defined, otherwise in the temporary directory.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        return os.path.join(base, "dbtidy.sock")
+    return os.path.join("/tmp", "dbtidy-%d.sock" % os.getuid())
+
+
+# JSON-RPC error codes.
+#
+parse_error = -32700
+invalid_request = -32600
+method_not_found = -32601
+invalid_params = -32602
+server_error = -32000
+
+
+class request_error (Exception):
+    """ Raised by a method to send an error response.
+    """
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+
+# -----------------------------------------------------------------------------
+#
+class result_cache (object):
+    """ A bounded, least recently used, map of content digest to result.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def lookup(self, key):
+        """ Returns the result for key, or None.
+        """
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+
+    def update(self, key, result):
+        """ Records result, discarding the least recently used if full.
+        """
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+# -----------------------------------------------------------------------------
+#
+class tidy_server (object):
+    """ Handles requests, with a cache of recent results keyed by the digest
+        of the content and the parameters that affect the result.
+    """
+
+    def __init__(self, cache_size=256):
+        self.results = result_cache(cache_size)
+        self.running = True
+        self.methods = {"tidy": self.tidy,
+                        "tidy_file": self.tidy_file,
+                        "version": self.version,
+                        "shutdown": self.shutdown}
+
+
+    def tidy(self, text, filename="<text>", lines=None):
+        """ Returns the tidy form of text, as a result dict.
+        """
+        if not isinstance(text, str):
+            raise request_error(invalid_params, "text must be a string")
+
+        data = text.encode("utf-8", "surrogatepass")
+        tidy, warnings = self.cached("tidy", filename, data, lines,
+                                     lambda: self.tidy_text(text, filename, lines))
+        return {"text": tidy, "changed": tidy != text, "warnings": warnings}
+
+
+    def tidy_text(self, text, filename, lines):
+        if lines is None:
+            return dbtidy_lib.tidy_text(text, filename)
+        first, last = lines
+        return dbtidy_lib.tidy_range(text, first, last, filename)
+
+
+    def tidy_file(self, path, lines=None, check=False):
+        """ Tidies the file path in place, as per the command line. When check
+            is true, the file is not modified.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        common.source_file_name = path
+        tidy_data, warnings = self.cached("tidy_file", path, data, lines,
+                                          lambda: self.tidy_data(path, data, lines))
+
+        if check:
+            return {"tidy": tidy_data == data, "warnings": warnings}
+
+        if tidy_data != data:
+            main.write_tidy_file(path, path + ".~", tidy_data)
+        return {"changed": tidy_data != data, "warnings": warnings}
+
+
+    def tidy_data(self, path, data, lines):
+        if lines is None:
+            return dbtidy_lib.process_data(path, data)
+        first, last = lines
+        return dbtidy_lib.process_range_data(path, data, first, last)
+
+
+    def cached(self, method, filename, data, lines, function):
+        """ Returns the (result, warnings) of function, which tidies data for
+            method, either from the cache or by calling function.
+        """
+        if lines is not None:
+            if not (isinstance(lines, list) and len(lines) == 2 and
+                    all(isinstance(number, int) for number in lines)):
+                raise request_error(invalid_params, "lines must be [first, last]")
+            lines = tuple(lines)
+
+        # Warnings include the filename and the line numbers, so both form
+        # part of the key. So does the method, as tidy results are text, and
+        # tidy_file results bytes.
+        #
+        key = (method, cache.content_digest(data), filename, lines)
+        entry = self.results.lookup(key)
+        if entry is None:
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                result = function()
+            entry = (result, err.getvalue().splitlines())
+            self.results.update(key, entry)
+        return entry
+
+
+    def version(self):
+        return __version__
+
+
+    def shutdown(self):
+        self.running = False
+        return None
+
+
+    def call(self, method, params):
+        """ Calls method with params, either a dict or a list.
+        """
+        function = self.methods.get(method)
+        if function is None:
+            raise request_error(method_not_found, "no such method: %s" % method)
+
+        # Only a failure to bind the params is an invalid params error. Any
+        # other error within the method is a server error.
+        #
+        try:
+            if isinstance(params, dict):
+                arguments = inspect.signature(function).bind(**params)
+            else:
+                arguments = inspect.signature(function).bind(*params)
+        except TypeError as error:
+            raise request_error(invalid_params, str(error))
+
+        return function(*arguments.args, **arguments.kwargs)
+
+
+    def handle(self, line):
+        """ Handles a request line, and returns the response line, or None
+            if the request is a notification.
+        """
+        ident = None
+        try:
+            try:
+                message = json.loads(line)
+            except ValueError as error:
+                raise request_error(parse_error, str(error))
+
+            if not isinstance(message, dict) or \
+                    not isinstance(message.get("method"), str):
+                raise request_error(invalid_request, "invalid request")
+
+            ident = message.get("id")
+            result = self.call(message["method"], message.get("params", {}))
+            if "id" not in message:
+                return None
+            response = {"jsonrpc": "2.0", "id": ident, "result": result}
+
+        except request_error as error:
+            response = {"jsonrpc": "2.0", "id": ident,
+                        "error": {"code": error.code, "message": error.message}}
+
+        except Exception as error:
+            response = {"jsonrpc": "2.0", "id": ident,
+                        "error": {"code": server_error, "message": str(error)}}
+
+        return json.dumps(response) + "\n"
+
+
+    def serve_stream(self, reader, writer):
+        """ Handles requests read from reader, until end of file or shut down,
+            writing each response to writer.
+        """
+        for line in reader:
+            if not line.strip():
+                continue
+            response = self.handle(line)
+            if response is not None:
+                writer.write(response)
+                writer.flush()
+            if not self.running:
+                break
+
+
+    def serve_socket(self, address):
+        """ Listens on the Unix domain socket address, handling each connection
+            in turn, until shut down.
+        """
+        if os.path.exists(address):
+            os.unlink(address)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(address)
+            os.chmod(address, 0o600)
+            listener.listen(8)
+            while self.running:
+                connection, _ = listener.accept()
+                with connection:
+                    stream = connection.makefile('rw', encoding="utf-8",
+                                                 errors="surrogatepass", newline="\n")
+                    with stream:
+                        self.serve_stream(stream, stream)
+        finally:
+            listener.close()
+            if os.path.exists(address):
+                os.unlink(address)
+
+
+# -----------------------------------------------------------------------------
+#
+def serve(address=None):
+    """ Runs the server on the standard input and output, or if address is
+        specified, on that Unix domain socket.
+    """
+    server = tidy_server()
+    if address is None:
+        server.serve_stream(sys.stdin, sys.stdout)
+    else:
+        server.serve_socket(address)
+
+# end
@@ -0,0 +1,82 @@
+""" This module provides the per file timing and counters collected when
+    statistics are requested, e.g. by the --stats option.
+"""
+
+import collections
+
+from . import lexer
+
+
+# -----------------------------------------------------------------------------
+#
+class file_stats (object):
+    """ Timings (in seconds) and counters for processing a single file.
+        The token counts, and the lex and format times, are only measured
+        when the file is lexed before it is formatted, see lexed, so are
+        omitted when it is not, e.g. when filtering the standard input.
+    """
+
+    counters = ("lines_in", "lines_out", "records", "bytes_in", "bytes_out",
+                "warnings")
+
+    timings = ("read_time", "lex_time", "format_time", "write_time")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.token_counts = {}     # indexed by lex_kinds name
+        self.lexed = False         # the tokens are counted, lex and format timed
+        for name in self.counters + self.timings:
+            setattr(self, name, 0)
+
+
+    def count_tokens(self, kinds):
+        """ Adds the counts of each of kind codes in kinds, e.g. an array.
+        """
+        for code, count in collections.Counter(kinds).items():
+            name = lexer.kind_of_code[code].name
+            self.token_counts[name] = self.token_counts.get(name, 0) + count
+
+
+    @property
+    def tokens(self):
+        return sum(self.token_counts.values())
+
+
+    def add(self, other):
+        """ Accumulates other's timings and counters, e.g. to form totals.
+        """
+        for name in self.counters + self.timings:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.lexed = self.lexed or other.lexed
+        for name, count in other.token_counts.items():
+            self.token_counts[name] = self.token_counts.get(name, 0) + count
+
+
+    def as_dict(self):
+        result = {"filename": self.filename}
+        if self.lexed:
+            result["tokens"] = self.tokens
+            result["token_counts"] = dict(sorted(self.token_counts.items()))
+        for name in self.counters + self.timings:
+            if self.lexed or name not in ("lex_time", "format_time"):
+                result[name] = getattr(self, name)
+        return result
+
+
+    def summary(self):
+        """ Returns a one line human readable summary.
+        """
+        if not self.lexed:
+            return ("read %.4fs  write %.4fs  "
+                    "%d/%d lines  %d records  %d/%d bytes  %d warnings" %
+                    (self.read_time, self.write_time,
+                     self.lines_in, self.lines_out, self.records,
+                     self.bytes_in, self.bytes_out, self.warnings))
+
+        return ("read %.4fs  lex %.4fs  format %.4fs  write %.4fs  "
+                "%d tokens  %d/%d lines  %d records  %d/%d bytes  %d warnings" %
+                (self.read_time, self.lex_time, self.format_time, self.write_time,
+                 self.tokens, self.lines_in, self.lines_out, self.records,
+                 self.bytes_in, self.bytes_out, self.warnings))
+
+# end
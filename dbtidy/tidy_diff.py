@@ -0,0 +1,235 @@
+""" This module provides the unified diff of the changes tidying would make.
+    Tidying only changes the white space between the tokens, and never adds,
+    removes or reorders them, so the input and output lines may be aligned by
+    the tokens they hold, in a single linear pass, rather than by a general
+    (and, in the worst case, quadratic) difference algorithm such as difflib.
+"""
+
+import io
+import os
+import time
+
+from . import dbtidy_lib
+from . import lexer
+
+
+class token_lines (object):
+    """ Records the line number of each token of a source as the tokens are
+        passed on, unchanged, via tokens, e.g. to layout.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.items = iter(())
+
+
+    def attach(self, source):
+        """ Attaches the source, e.g. a lex_file or token_buffer; returns self.
+        """
+        self.items = source.tokens()
+        return self
+
+
+    def tokens(self):
+        """ As per lex_file.tokens.
+        """
+        append = self.lines.append
+        for item in self.items:
+            append(item[2])
+            yield item
+
+
+# -----------------------------------------------------------------------------
+#
+def split_lines(text):
+    """ Returns the lines of text, each including its new line, if any. Only
+        a '\\n' ends a line, as per the lexer's line numbers.
+    """
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def token_blocks(records, token_line_numbers, tidy_lines):
+    """ Generates the (input end, output end) line counts at which both the
+        input and output may be cut, i.e. where no input line has tokens that
+        are output on both sides of the cut. The records are the layout line
+        records, and each line's text is appended to tidy_lines. The blank
+        lines before a line with tokens go with that line.
+    """
+    token_index = 0
+    input_end = 0       # the last input line with tokens seen so far
+    output_end = 0      # the last output line with tokens
+    for record in records:
+        tidy_lines.append(dbtidy_lib.render_line(record))
+        parts = record[1]
+        if parts:
+            count = (len(parts) + 1) // 2
+            first = token_line_numbers[token_index]
+            last = token_line_numbers[token_index + count - 1]
+            token_index += count
+
+            if first > input_end:
+                yield input_end, output_end
+            input_end = max(input_end, last)
+            output_end = len(tidy_lines)
+
+
+def opcodes(lines, tidy_lines, cuts):
+    """ Generates the ("equal" or "replace", i1, i2, j1, j2) operations that
+        change lines into tidy_lines, as per difflib.SequenceMatcher, given the
+        (i, j) cuts that divide both into corresponding blocks. Lines common
+        to the start or end of a block are reported as equal, and adjacent
+        operations with the same tag are merged.
+    """
+    pending = None
+    i1 = j1 = 0
+    for i2, j2 in cuts:
+        if (i2, j2) == (i1, j1):
+            continue
+
+        # Trim the lines common to the start and end of the block.
+        #
+        a1, b1 = i1, j1
+        while a1 < i2 and b1 < j2 and lines[a1] == tidy_lines[b1]:
+            a1 += 1
+            b1 += 1
+        a2, b2 = i2, j2
+        while a2 > a1 and b2 > b1 and lines[a2 - 1] == tidy_lines[b2 - 1]:
+            a2 -= 1
+            b2 -= 1
+
+        for tag, x1, x2, y1, y2 in (("equal", i1, a1, j1, b1),
+                                    ("replace", a1, a2, b1, b2),
+                                    ("equal", a2, i2, b2, j2)):
+            if x1 == x2 and y1 == y2:
+                continue
+            if pending is not None and pending[0] == tag:
+                pending = (tag, pending[1], x2, pending[3], y2)
+            else:
+                if pending is not None:
+                    yield pending
+                pending = (tag, x1, x2, y1, y2)
+
+        i1, j1 = i2, j2
+
+    if pending is not None:
+        yield pending
+
+
+def grouped(operations, context=3):
+    """ Generates the groups of operations, each with up to context lines of
+        equal lines either side, as per SequenceMatcher.get_grouped_opcodes.
+        Groups with no changes are not generated.
+    """
+    group = []
+    for tag, i1, i2, j1, j2 in operations:
+        if tag == "equal":
+            if not group:
+                # Leading context only.
+                #
+                group.append((tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2))
+                continue
+
+            if i2 - i1 > 2 * context:
+                group.append((tag, i1, i1 + context, j1, j1 + context))
+                if any(operation[0] != "equal" for operation in group):
+                    yield group
+                group = [(tag, i2 - context, i2, j2 - context, j2)]
+                continue
+
+        group.append((tag, i1, i2, j1, j2))
+
+    # Trim any trailing context.
+    #
+    if group and group[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = group[-1]
+        group[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+    if any(operation[0] != "equal" for operation in group):
+        yield group
+
+
+def _range(start, stop):
+    """ The unified diff hunk range, as per difflib.
+    """
+    length = stop - start
+    if length == 1:
+        return "%d" % (start + 1)
+    if length == 0:
+        return "%d,0" % start
+    return "%d,%d" % (start + 1, length)
+
+
+def _line(prefix, line):
+    if line.endswith('\n'):
+        return prefix + line
+    return prefix + line + "\n\\ No newline at end of file\n"
+
+
+def unified_diff(filename, lines, tidy_lines, operations, context=3):
+    """ Returns the unified diff text, from lines to tidy_lines, of the
+        operations, as per opcodes. Returns "" if there are no differences.
+    """
+    out = []
+    for group in grouped(operations, context):
+        if not out:
+            out.append("--- %s\n+++ %s\n" % (filename, filename))
+        out.append("@@ -%s +%s @@\n" % (_range(group[0][1], group[-1][2]),
+                                        _range(group[0][3], group[-1][4])))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                out.extend(_line(' ', line) for line in lines[i1:i2])
+            else:
+                out.extend(_line('-', line) for line in lines[i1:i2])
+                out.extend(_line('+', line) for line in tidy_lines[j1:j2])
+    return "".join(out)
+
+
+# -----------------------------------------------------------------------------
+#
+def diff_data(filename, data, bulk=False, stats=None, names=None, schema=None, context=3,
+              binary=False):
+    """ Tidies data, the entire content of filename (as bytes), as per
+        process_data, and returns the tidy content and the unified diff text
+        of the changes, with context lines of context. The diff is of the text,
+        so excludes any change of line endings only.
+    """
+    stream = dbtidy_lib.data_stream(data, binary)
+    text = stream.read()
+    lines = split_lines(text)
+
+    recorder = token_lines()
+    tidy_lines = []
+    with lexer.lex_file(filename, bulk, io.StringIO(text), stats, binary) as source:
+        tokens = dbtidy_lib.lex_source(source, stats)
+        start = time.perf_counter()
+        records = dbtidy_lib.layout(recorder.attach(dbtidy_lib.observe(tokens, stats,
+                                                                      names, schema)),
+                                    stats)
+        cuts = list(token_blocks(records, recorder.lines, tidy_lines))
+        if stats is not None:
+            stats.format_time += time.perf_counter() - start
+    cuts.append((len(lines), len(tidy_lines)))
+
+    diff = unified_diff(filename, lines, tidy_lines, opcodes(lines, tidy_lines, cuts), context)
+
+    tidy_text = "".join(tidy_lines)
+    if os.linesep != '\n' and not binary:
+        tidy_text = tidy_text.replace('\n', os.linesep)
+    return tidy_text.encode(stream.encoding), diff
+
+
+def diff_range_data(filename, data, tidy_data, context=3, binary=False):
+    """ Returns the unified diff text from data to tidy_data (both bytes),
+        which must differ only in one contiguous run of lines, e.g. as tidied
+        by process_range_data.
+    """
+    lines = split_lines(dbtidy_lib.data_stream(data, binary).read())
+    tidy_lines = split_lines(dbtidy_lib.data_stream(tidy_data, binary).read())
+    return unified_diff(filename, lines, tidy_lines,
+                        opcodes(lines, tidy_lines, [(len(lines), len(tidy_lines))]), context)
+
+# end
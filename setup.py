@@ -40,6 +40,7 @@ setup(name="dbtidy",
       entry_points="""
           [console_scripts]
           dbtidy=dbtidy.main:main
+          dbtidy-client=dbtidy.client:main
       """
 ) 
 
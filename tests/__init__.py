@@ -0,0 +1,2 @@
+""" dbtidy regression tests, e.g.  python -m unittest discover tests
+"""
@@ -0,0 +1,126 @@
+""" Tests of the command line interface.
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from dbtidy import main
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def dbtidy(*args, stdin=b""):
+    """ Runs dbtidy as a new process, and returns its exit status and output.
+    """
+    env = dict(os.environ, PYTHONPATH=top, PYTHONUTF8="1")
+    result = subprocess.run([sys.executable, "-m", "dbtidy"] + list(args), input=stdin,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    return result.returncode, result.stdout
+
+
+def crash(filename, opts=None, known=None):
+    """ Replaces main.process_argument_captured, to kill the worker process.
+    """
+    os._exit(1)
+
+
+class main_test (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+    def test_bytes_diff_jobs(self):
+        # Byte mode diffs from worker processes are the original bytes.
+        #
+        data = b'record(ai, "caf\xe9") {\nfield(DESC, "\xe9\xff")\n}\n'
+        paths = [self.write("%d.db" % n, data) for n in range(3)]
+
+        status, serial = dbtidy("--bytes", "--diff", *paths)
+        self.assertEqual(status, 1)
+        self.assertIn(b'"caf\xe9"', serial)
+        self.assertEqual(dbtidy("--bytes", "--diff", "-j", "2", *paths), (status, serial))
+
+
+    def test_bytes_crlf(self):
+        # In byte mode, a '\r' at the end of a line is removed as white space.
+        #
+        path = self.write("crlf.db", b'record(ai, "x\r") {\r\nfield(VAL, "1")\r\n}\r\n')
+        self.assertEqual(dbtidy("--bytes", path)[0], 0)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'record (ai, "x\r") {\n    field (VAL,  "1")\n}\n')
+
+
+    def test_check_status(self):
+        tidy = self.write("tidy.db", b'record (ai, "x") {\n}\n')
+        untidy = self.write("untidy.db", b'record(ai, "x") {\n}\n')
+        undecodable = self.write("undecodable.db", b'record(ai, "\xff") {\n}\n')
+
+        self.assertEqual(dbtidy("--check", tidy)[0], 0)
+        self.assertEqual(dbtidy("--check", tidy, untidy)[0], 1)
+        self.assertEqual(dbtidy("--check", untidy, undecodable)[0], 2)
+        self.assertEqual(dbtidy("--diff", undecodable)[0], 2)
+
+
+    def test_stats_json(self):
+        # The tokens are counted however each file is processed.
+        #
+        data = b'record(ai, "x") {\nfield(VAL, "1")\n}\n'
+        path = os.path.join(self.directory.name, "stats.json")
+        for args in ([], ["--check"], ["--diff"], ["--lines=1"]):
+            status, output = dbtidy("--stats-json=" + path, self.write("x.db", data), *args)
+            with open(path, 'r') as f:
+                self.assertEqual(json.loads(f.read())["tokens"], 14, args)
+
+
+    def test_stdin_stats_json(self):
+        path = os.path.join(self.directory.name, "stats.json")
+        status, output = dbtidy("--stats-json=" + path, "-", stdin=b'record(ai, "x") {\n}\n')
+        self.assertEqual((status, output), (0, b'record (ai, "x") {\n}\n'))
+        with open(path, 'r') as f:
+            stats = json.loads(f.read())
+        self.assertEqual(stats["filename"], "<stdin>")
+        self.assertNotIn("tokens", stats)     # not lexed before formatting
+
+        self.assertEqual(dbtidy("--stats-json=-", "-")[0], 1)
+
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == "fork",
+                         "worker processes must inherit the mock")
+    def test_worker_crash(self):
+        # Files whose worker process dies are counted as errors.
+        #
+        paths = [self.write("%d.db" % n, b'record(ai, "x") {\n}\n') for n in range(5)]
+        opts = main.options()
+        opts.check = True
+        messages = io.StringIO()
+        with mock.patch.object(main, "process_argument_captured", crash), \
+                contextlib.redirect_stdout(messages), contextlib.redirect_stderr(messages):
+            self.assertEqual(main.process_arguments(paths, opts, jobs=2), (5, 0, 5))
+        self.assertIn("%s: failed" % paths[0], messages.getvalue())
+        self.assertIn("BrokenProcessPool", messages.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# end
@@ -0,0 +1,41 @@
+""" Tests of the record name and alias collection.
+"""
+
+import io
+import pickle
+import unittest
+
+from dbtidy import lexer
+from dbtidy import name_index
+
+text = '''record(ai, "a") {
+    alias("b")
+    field(INP, "x")
+}
+grecord(bo, "$(P)c") {
+}
+alias("a", "d")
+menu(m) {
+    alias("e")
+}
+'''
+
+
+class name_collector_test (unittest.TestCase):
+
+    def test_collect(self):
+        names = name_index.name_collector()
+        with lexer.lex_file("<test>", True, io.StringIO(text)) as source:
+            for _ in names.attach(source).tokens():
+                pass
+        self.assertEqual(names.records, [("a", 1, "ai"), ("$(P)c", 5, "bo")])
+        self.assertEqual(names.aliases, [("b", "a", 2), ("d", "a", 7)])
+
+        names = pickle.loads(pickle.dumps(names))
+        self.assertEqual(names.records, [("a", 1, "ai"), ("$(P)c", 5, "bo")])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# end
@@ -0,0 +1,63 @@
+""" Tests of the JSON-RPC server.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from dbtidy import server
+
+untidy = 'record(ai, "x") {\nfield(VAL, "1")\n}\n'
+
+
+class server_test (unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.tidy_server()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "test.db")
+        with open(self.path, 'w') as f:
+            f.write(untidy)
+
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+    def request(self, method, params):
+        response = json.loads(self.server.handle(json.dumps(
+            {"jsonrpc": "2.0", "id": 1, "method": method, "params": params})))
+        return response.get("result"), response.get("error")
+
+
+    def test_tidy_then_tidy_file(self):
+        # The same path and content are tidied as text, then as a file: the
+        # cached text result must not be used to write the file.
+        #
+        tidy, error = self.request("tidy", {"text": untidy, "filename": self.path})
+        self.assertIsNone(error)
+
+        result, error = self.request("tidy_file", {"path": self.path})
+        self.assertIsNone(error)
+        self.assertTrue(result["changed"])
+        with open(self.path, 'r') as f:
+            self.assertEqual(f.read(), tidy["text"])
+        with open(self.path + ".~", 'r') as f:
+            self.assertEqual(f.read(), untidy)
+
+
+    def test_invalid_params(self):
+        _, error = self.request("tidy", {"txt": untidy})
+        self.assertEqual(error["code"], server.invalid_params)
+
+
+    def test_internal_error(self):
+        _, error = self.request("tidy_file", {"path": self.path + ".missing"})
+        self.assertEqual(error["code"], server.server_error)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# end